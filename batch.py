@@ -0,0 +1,6 @@
+# batch.py (place this in the parent directory, next to the photo_editor folder)
+import sys
+from photo_editor.batch import main
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,347 @@
+# benchmarks/bench_processing.py
+"""
+Benchmarks for the processing hot paths.
+
+Usage:
+    python -m benchmarks.bench_processing                       # all sizes, save results
+    python -m benchmarks.bench_processing --sizes 0.5 4 --repeat 3
+    python -m benchmarks.bench_processing --baseline baseline.json   # report regressions
+    python -m benchmarks.bench_processing --fixtures photos/     # also time real photos
+
+Every benchmark image is generated deterministically (or resized from a
+fixture) so runs are comparable across machines and commits. Results hold
+wall time and peak memory per stage and are written as JSON; pass an older
+results file as --baseline to flag stages that got slower. Stages whose
+peak allocation per megapixel passes MEMORY_CEILINGS_MB_PER_MP fail the run.
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+import cv2
+import numpy as np
+from photo_editor.processing.image_operations import ImageProcessor, SEGMENTATION_PRESETS
+from photo_editor.processing.quantize import quantize_colors
+from photo_editor.processing.region_stats import paint_regions
+
+DEFAULT_SIZES = (0.5, 4, 24, 100)  # Megapixels
+KMEANS_CLUSTERS = 8
+
+# Peak traced allocation allowed per megapixel of input, by stage. Images
+# below MEMORY_CHECK_MIN_MEGAPIXELS are skipped: fixed overheads dominate.
+MEMORY_CEILINGS_MB_PER_MP = {
+    'apply_grayscale': 6,
+    'kmeans_clustering': 80,
+    'get_qt_image': 1,
+    'smooth_segmentation': 90,
+    'superpixels': 90,
+    'palette': 40,
+    'edge_mask': 4,
+    'edge_blend': 8,
+    'smoothing': 4,
+    'sharpen': 4,
+}
+MEMORY_CHECK_MIN_MEGAPIXELS = 2
+
+def synthetic_image(megapixels, seed=0):
+    """
+    Deterministic 3:2 test image with smooth gradients, flat shapes, hard
+    edges and fine noise, roughly like a photo as far as the pipeline cares.
+    """
+    width = int(round((megapixels * 1e6 * 1.5) ** 0.5))
+    height = int(round(width / 1.5))
+    rng = np.random.default_rng(seed)
+
+    # Background gradients per channel
+    ys = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    xs = np.linspace(0, 1, width, dtype=np.float32)[None, :]
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[..., 0] = (255 * xs * (1 - ys)).astype(np.uint8)
+    image[..., 1] = (255 * ys).astype(np.uint8)
+    image[..., 2] = (255 * (1 - xs) * (0.5 + 0.5 * ys)).astype(np.uint8)
+
+    # Flat coloured shapes with hard edges, scaled with the image
+    scale = width / 1000
+    for _ in range(40):
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        if rng.random() < 0.5:
+            cv2.circle(image, center, int(rng.integers(20, 120) * scale), color, -1)
+        else:
+            size = rng.integers(30, 200, 2) * scale
+            cv2.rectangle(image, center, (int(center[0] + size[0]), int(center[1] + size[1])),
+                          color, -1)
+
+    # Sensor-like noise
+    noise = rng.normal(0, 6, (height, width, 1)).astype(np.int16)
+    return np.clip(image.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+def fixture_images(directory, megapixels):
+    """Resize every image in a fixtures directory to the given size."""
+    for path in sorted(glob.glob(os.path.join(directory, '*'))):
+        image = cv2.imread(path)
+        if image is None:
+            continue
+        height, width = image.shape[:2]
+        scale = (megapixels * 1e6 / (height * width)) ** 0.5
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+        yield os.path.basename(path), cv2.resize(image, size, interpolation=interpolation)
+
+def _rss_bytes():
+    """Current resident set size, or 0 where it can't be read cheaply."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+class PeakMemory:
+    """
+    Track peak memory of a block: Python/NumPy allocations via tracemalloc,
+    plus resident set size sampled on a thread to catch OpenCV buffers.
+    """
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak_alloc = 0
+        self.peak_rss = 0
+
+    def __enter__(self):
+        self._stop = threading.Event()
+        self._base_rss = _rss_bytes()
+        self._max_rss = self._base_rss
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        tracemalloc.start()
+        self._sampler.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self._max_rss = max(self._max_rss, _rss_bytes())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._sampler.join()
+        self._max_rss = max(self._max_rss, _rss_bytes())
+        _, self.peak_alloc = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.peak_rss = max(0, self._max_rss - self._base_rss)
+        return False
+
+def measure(func, repeat):
+    """Run func repeat times; return the fastest time and the largest peaks."""
+    best = None
+    peak_alloc = peak_rss = 0
+    result = None
+    for _ in range(repeat):
+        with PeakMemory() as memory:
+            start = time.perf_counter()
+            result = func()
+            seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+        peak_alloc = max(peak_alloc, memory.peak_alloc)
+        peak_rss = max(peak_rss, memory.peak_rss)
+    return result, {'seconds': best,
+                    'peak_alloc_mb': peak_alloc / 2 ** 20,
+                    'peak_rss_mb': peak_rss / 2 ** 20}
+
+def segmentation_stages(processor, image, params):
+    """
+    Yield (stage, thunk) for each smooth_segmentation stage in pipeline
+    order, feeding every stage the real output of the one before it.
+    """
+    state = {}
+
+    def superpixels():
+        state['superpixels'] = processor._superpixel_means(image, params)
+        return state['superpixels']
+
+    def palette():
+        pixels = state['superpixels'].reshape(-1, 3)
+        centers, labels = quantize_colors(pixels, params.n_colors, method=params.quantize_method)
+        state['palette'] = paint_regions(labels, centers, np.uint8).reshape(image.shape)
+        return state['palette']
+
+    def edge_mask():
+        state['edges'] = processor._edge_mask(image)
+        return state['edges']
+
+    def edge_blend():
+        state['blend'] = processor._preserve_edges(
+            image, state['palette'].copy(), params, state['edges'])
+        return state['blend']
+
+    def smoothing():
+        state['smooth'] = processor._smooth(state['blend'], params)
+        return state['smooth']
+
+    def sharpen():
+        return processor._sharpen(state['smooth'], params)
+
+    yield 'superpixels', superpixels
+    yield 'palette', palette
+    yield 'edge_mask', edge_mask
+    yield 'edge_blend', edge_blend
+    yield 'smoothing', smoothing
+    yield 'sharpen', sharpen
+
+def run_benchmarks(sizes, presets, repeat=1, fixtures=None, log=print):
+    """Benchmark every image size against every preset; return a list of records."""
+    records = []
+
+    try:
+        from PySide6.QtGui import QImage  # noqa: F401
+        have_qt = True
+    except ImportError:
+        have_qt = False
+
+    for megapixels in sizes:
+        images = [('synthetic', synthetic_image(megapixels))]
+        if fixtures:
+            images.extend(fixture_images(fixtures, megapixels))
+
+        for image_name, image in images:
+            def record(preset, stage, stats):
+                entry = {'image': image_name, 'megapixels': megapixels,
+                         'preset': preset, 'stage': stage, **stats}
+                records.append(entry)
+                log(f"{image_name:>12} {megapixels:>6}MP {preset:>10} {stage:<22}"
+                    f"{stats['seconds']:9.3f}s {stats['peak_rss_mb']:9.1f}MB"
+                    f"{stats['peak_alloc_mb'] / megapixels:9.1f}MB/MP")
+
+            processor = ImageProcessor()
+
+            # Single-operation benchmarks
+            _, stats = measure(lambda: processor.grayscale(image), repeat)
+            record('-', 'apply_grayscale', stats)
+            # A cold palette cache every time, so repeats time the full fit
+            def kmeans_run():
+                processor.palette_cache.clear()
+                return processor.kmeans_clustering(image, KMEANS_CLUSTERS)
+            _, stats = measure(kmeans_run, repeat)
+            record('-', 'kmeans_clustering', stats)
+            if have_qt:
+                _, stats = measure(lambda: processor.get_qt_image(image), repeat)
+                record('-', 'get_qt_image', stats)
+
+            for preset_name, params in presets.items():
+                # Whole pipeline with a cold stage cache every time
+                def full_run():
+                    processor.stage_cache.clear()
+                    processor.palette_cache.clear()
+                    return processor.smooth_segmentation(image, params)
+                _, stats = measure(full_run, repeat)
+                record(preset_name, 'smooth_segmentation', stats)
+
+                # Individual stages only where the untiled path would run them
+                if processor.tiling is not None and processor.tiling.needs_tiling(image):
+                    continue
+                for stage, thunk in segmentation_stages(processor, image, params):
+                    _, stats = measure(thunk, repeat)
+                    record(preset_name, stage, stats)
+
+    return records
+
+def memory_violations(records, ceilings=MEMORY_CEILINGS_MB_PER_MP,
+                      min_megapixels=MEMORY_CHECK_MIN_MEGAPIXELS):
+    """
+    Return (record, mb_per_megapixel, ceiling) for every stage whose peak
+    traced allocation per megapixel is above its ceiling.
+    """
+    violations = []
+    for entry in records:
+        ceiling = ceilings.get(entry['stage'])
+        if ceiling is None or entry['megapixels'] < min_megapixels:
+            continue
+        per_megapixel = entry['peak_alloc_mb'] / entry['megapixels']
+        if per_megapixel > ceiling:
+            violations.append((entry, per_megapixel, ceiling))
+    return violations
+
+def compare(records, baseline, tolerance, min_delta=0.01):
+    """
+    Return (record, baseline_seconds, ratio) for every stage slower than
+    tolerance allows. Slowdowns under min_delta seconds are timer noise.
+    """
+    def key(entry):
+        return (entry['image'], entry['megapixels'], entry['preset'], entry['stage'])
+
+    previous = {key(entry): entry for entry in baseline['results']}
+    regressions = []
+    for entry in records:
+        old = previous.get(key(entry))
+        if old is None or old['seconds'] <= 0:
+            continue
+        ratio = entry['seconds'] / old['seconds']
+        if ratio > 1 + tolerance and entry['seconds'] - old['seconds'] > min_delta:
+            regressions.append((entry, old['seconds'], ratio))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.bench_processing",
+        description="Time the processing hot paths across image sizes and presets.")
+    parser.add_argument('--sizes', type=float, nargs='+', default=list(DEFAULT_SIZES),
+                        help="Image sizes in megapixels (default: 0.5 4 24 100)")
+    parser.add_argument('--presets', nargs='+', default=sorted(SEGMENTATION_PRESETS),
+                        choices=sorted(SEGMENTATION_PRESETS))
+    parser.add_argument('--repeat', type=int, default=1, help="Runs per measurement; fastest wins")
+    parser.add_argument('--fixtures', help="Directory of real images to benchmark as well")
+    parser.add_argument('--output', default='benchmark_results.json', help="Results JSON path")
+    parser.add_argument('--baseline', help="Earlier results JSON to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help="Allowed slowdown before a stage is reported (default: 0.15)")
+    parser.add_argument('--min-delta', type=float, default=0.01,
+                        help="Ignore slowdowns smaller than this many seconds")
+    parser.add_argument('--no-memory-check', action='store_true',
+                        help="Don't fail on stages over their memory-per-megapixel ceiling")
+    args = parser.parse_args(argv)
+
+    presets = {name: SEGMENTATION_PRESETS[name] for name in args.presets}
+    records = run_benchmarks(args.sizes, presets, args.repeat, args.fixtures)
+
+    results = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'cpu_count': os.cpu_count(),
+            'repeat': args.repeat,
+        },
+        'results': records,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved {len(records)} measurements to {args.output}")
+
+    status = 0
+    if not args.no_memory_check:
+        violations = memory_violations(records)
+        for entry, per_megapixel, ceiling in violations:
+            print(f"MEMORY {entry['image']} {entry['megapixels']}MP {entry['preset']} "
+                  f"{entry['stage']}: {per_megapixel:.1f}MB/MP over the {ceiling}MB/MP ceiling")
+        if violations:
+            status = 1
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(records, baseline, args.tolerance, args.min_delta)
+        for entry, old_seconds, ratio in regressions:
+            print(f"REGRESSION {entry['image']} {entry['megapixels']}MP {entry['preset']} "
+                  f"{entry['stage']}: {old_seconds:.3f}s -> {entry['seconds']:.3f}s "
+                  f"({ratio:.2f}x)")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,349 @@
+# photo_editor/batch.py
+"""
+Headless batch processing: apply ImageProcessor operations to many files.
+
+Usage:
+    python -m photo_editor.batch INPUT [INPUT ...] -o OUTPUT_DIR --preset Cartoon
+    python -m photo_editor.batch "scans/*.png" -o out --params custom.json
+    python -m photo_editor.batch photos -o out --operation kmeans --k 8
+    python -m photo_editor.batch photos -o out --format .jpg --jpeg-quality 85 --progressive
+    python -m photo_editor.batch photos -o out --operation palette --palette-from ref.jpg --k 8
+    python -m photo_editor.batch photos -o out --operation palette --palette look.json
+
+Inputs are directories (searched for images) or glob patterns. Outputs mirror
+each file's path below its directory (or below the fixed part of its glob)
+under OUTPUT_DIR. This module never imports PySide6, so it runs on servers
+without a display.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+import cv2
+from photo_editor.processing.image_operations import (ImageProcessor, SegmentationParams,
+                                                      SEGMENTATION_PRESETS)
+from photo_editor.processing.backing_store import BackingStore
+from photo_editor.processing.encoding import EncoderOptions
+from photo_editor.processing.color_lut import ColorPalette, DEFAULT_LUT_SIZE, LUT_INTERPOLATIONS
+from photo_editor.processing.quantize import QUANTIZE_METHODS
+from photo_editor.processing.tracing import TRACE_MEMORY_ENV
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tif', '.tiff', '.webp')
+
+# Settings each output was written with, kept in the output directory
+MANIFEST_NAME = '.photo_editor_batch.json'
+
+@dataclass
+class BatchTask:
+    """One file to process and where to write it"""
+    input_path: str
+    output_path: str
+    operation: str    # 'segmentation', 'kmeans', 'palette' or 'grayscale'
+    options: dict
+    encoder: EncoderOptions = None
+
+    def signature(self):
+        """Digest of everything besides the input file that decides the output."""
+        settings = repr((self.operation, sorted(self.options.items()), self.encoder))
+        return hashlib.sha1(settings.encode()).hexdigest()
+
+@dataclass
+class BatchResult:
+    input_path: str
+    status: str       # 'done' or 'failed'
+    pixels: int = 0
+    seconds: float = 0.0
+    output_bytes: int = 0
+    encode_seconds: float = 0.0
+    peak_bytes: int = 0  # Peak traced allocation of the operation, with --trace-memory
+    error: str = ''
+
+def _glob_root(pattern):
+    """The leading directories of a glob pattern that contain no wildcards."""
+    parts = []
+    for part in os.path.normpath(pattern).split(os.sep)[:-1]:
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return os.sep.join(parts) or os.curdir
+
+def find_images(inputs, recursive=False):
+    """
+    Expand directories and glob patterns into a sorted list of
+    (image path, path relative to its input root) pairs.
+    """
+    paths = {}
+    for item in inputs:
+        if os.path.isdir(item):
+            pattern = os.path.join(item, '**', '*') if recursive else os.path.join(item, '*')
+            root = item
+        else:
+            pattern = item
+            root = _glob_root(item)
+        for path in glob.glob(pattern, recursive=recursive):
+            if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS):
+                paths.setdefault(os.path.abspath(path), os.path.relpath(path, root))
+    return sorted(paths.items())
+
+def output_path_for(relative_path, output_dir, suffix, extension):
+    """Mirror the input's path below its root under output_dir."""
+    name, original_extension = os.path.splitext(relative_path)
+    return os.path.join(output_dir, f"{name}{suffix}{extension or original_extension}")
+
+def load_manifest(output_dir):
+    """Output path (relative to output_dir) -> signature of the settings it was written with."""
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+def is_up_to_date(task, manifest, output_dir):
+    """
+    A file counts as processed if its output is newer than the input and
+    was written with the same operation, options and encoder settings.
+    """
+    key = os.path.relpath(task.output_path, output_dir)
+    return (manifest.get(key) == task.signature() and
+            os.path.exists(task.output_path) and
+            os.path.getmtime(task.output_path) >= os.path.getmtime(task.input_path))
+
+# One processor per worker process, reused across the files it handles
+_processor = None
+
+def _init_worker(scratch_dir=None):
+    global _processor
+    # Parallelism comes from the process pool; keep OpenCV single-threaded
+    cv2.setNumThreads(1)
+    _processor = ImageProcessor()
+    _processor.decode_cache = None  # Every file is read once
+    if scratch_dir:
+        _processor.set_backing_store(BackingStore(scratch_dir))
+
+def process_task(task):
+    """Load, process and save one file. Runs in a worker process."""
+    processor = _processor or ImageProcessor()
+    start = time.perf_counter()
+    try:
+        os.makedirs(os.path.dirname(task.output_path), exist_ok=True)
+        processor.load_image(task.input_path)
+        if not processor.has_image():
+            return BatchResult(task.input_path, 'failed', error="could not decode image")
+
+        if task.operation == 'segmentation':
+            processor.apply_smooth_segmentation(SegmentationParams(**task.options))
+        elif task.operation == 'kmeans':
+            processor.apply_kmeans(task.options['k'], task.options['method'])
+        elif task.operation == 'palette':
+            processor.lut_size = task.options['lut_size']
+            processor.apply_palette(task.options['palette'], task.options['interpolation'])
+        elif task.operation == 'grayscale':
+            processor.apply_grayscale()
+
+        # The operation's top-level span, recorded before the save starts a new one
+        peak_bytes = max((event.args.get('peak_bytes', 0) for event in processor.last_trace.events
+                          if event.depth == 0), default=0)
+        saved = processor.save_image(task.output_path, task.encoder)
+        height, width = processor.current_image.shape[:2]
+        return BatchResult(task.input_path, 'done', height * width,
+                           time.perf_counter() - start, saved.size, saved.encode_seconds,
+                           peak_bytes)
+    except Exception as e:
+        return BatchResult(task.input_path, 'failed', error=str(e))
+    finally:
+        # Drop this file's history and stage results before the next one
+        processor.history.clear()
+        processor.stage_cache.clear()
+
+def run_batch(tasks, workers=None, max_in_flight=None, progress=None, scratch_dir=None):
+    """
+    Run tasks on a process pool, keeping at most max_in_flight submitted at once
+    so memory stays bounded however many files there are. With scratch_dir,
+    large images are memory-mapped from files there instead of held in RAM.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 2
+    results = []
+    task_iter = iter(tasks)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(scratch_dir,)) as pool:
+        in_flight = set()
+        while True:
+            # Top up the window of submitted work
+            for task in task_iter:
+                in_flight.add(pool.submit(process_task, task))
+                if len(in_flight) >= max_in_flight:
+                    break
+            if not in_flight:
+                break
+
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                results.append(result)
+                if progress is not None:
+                    progress(result)
+    return results
+
+def load_params(args):
+    """Segmentation parameters from --params JSON or a named --preset."""
+    if args.params:
+        with open(args.params, 'r') as f:
+            return SegmentationParams(**json.load(f))
+    return SEGMENTATION_PRESETS[args.preset]
+
+def load_palette(args):
+    """The ColorPalette for --operation palette: from --palette JSON or fitted on --palette-from."""
+    if args.palette:
+        return ColorPalette.load(args.palette)
+    if not args.palette_from:
+        raise ValueError("--operation palette needs --palette or --palette-from")
+    processor = ImageProcessor()
+    processor.load_image(args.palette_from)
+    if not processor.has_image():
+        raise ValueError(f"Could not decode {args.palette_from}")
+    return processor.palette_from_image(processor.current_image, args.k, args.method)
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m photo_editor.batch",
+        description="Apply photo editor operations to directories or globs of images.")
+    parser.add_argument('inputs', nargs='+', help="Image directories or glob patterns")
+    parser.add_argument('-o', '--output', required=True, help="Directory for processed files")
+    parser.add_argument('--operation', choices=['segmentation', 'kmeans', 'palette', 'grayscale'],
+                        default='segmentation')
+    parser.add_argument('--preset', choices=sorted(SEGMENTATION_PRESETS), default='Cartoon',
+                        help="Segmentation preset (default: Cartoon)")
+    parser.add_argument('--params', help="JSON file of SegmentationParams fields")
+    parser.add_argument('--k', type=int, default=8, help="Colors for --operation kmeans")
+    parser.add_argument('--method', choices=QUANTIZE_METHODS, default='exact',
+                        help="Quantizer for --operation kmeans")
+    parser.add_argument('--palette', help="Palette JSON (saved from the editor) to apply")
+    parser.add_argument('--palette-from',
+                        help="Image to fit a --k colour palette on, applied to every input")
+    parser.add_argument('--save-palette', help="Also write the palette used to this JSON file")
+    parser.add_argument('--lut-size', type=int, default=DEFAULT_LUT_SIZE,
+                        help=f"Colour LUT grid points per channel, 256 is exact "
+                             f"(default: {DEFAULT_LUT_SIZE})")
+    parser.add_argument('--lut-interpolation', choices=LUT_INTERPOLATIONS, default='nearest')
+    parser.add_argument('--recursive', action='store_true', help="Search directories recursively")
+    parser.add_argument('--suffix', default='', help="Appended to output file names")
+    parser.add_argument('--format', dest='extension', default='',
+                        help="Output extension such as .png (default: same as input)")
+    parser.add_argument('--png-compression', type=int, choices=range(10), default=1,
+                        metavar='0-9', help="PNG compression level (default: 1)")
+    parser.add_argument('--jpeg-quality', type=int, default=95, help="JPEG quality 0-100")
+    parser.add_argument('--progressive', action='store_true', help="Write progressive JPEGs")
+    parser.add_argument('--optimize', action='store_true', help="Optimize JPEG Huffman tables")
+    parser.add_argument('--webp-quality', type=int, default=90, help="WebP quality 1-100")
+    parser.add_argument('--webp-lossless', action='store_true', help="Write lossless WebP")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes")
+    parser.add_argument('--max-in-flight', type=int, default=None,
+                        help="Files submitted at once (default: 2 x workers)")
+    parser.add_argument('--scratch-dir', default=None,
+                        help="Memory-map large working images from files in this directory")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="Report each file's peak allocation (slower: uses tracemalloc)")
+    parser.add_argument('--overwrite', action='store_true',
+                        help="Reprocess files whose output is already up to date (newer "
+                             "than the input and written with the same settings)")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.operation == 'segmentation':
+        options = vars(load_params(args))
+    elif args.operation == 'kmeans':
+        options = {'k': args.k, 'method': args.method}
+    elif args.operation == 'palette':
+        try:
+            palette = load_palette(args)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Could not load the palette: {e}", file=sys.stderr)
+            return 2
+        if args.save_palette:
+            palette.save(args.save_palette)
+        options = {'palette': palette, 'interpolation': args.lut_interpolation,
+                   'lut_size': args.lut_size}
+    else:
+        options = {}
+
+    os.makedirs(args.output, exist_ok=True)
+    if args.trace_memory:
+        os.environ[TRACE_MEMORY_ENV] = '1'  # Inherited by the worker processes
+    extension = args.extension
+    if extension and not extension.startswith('.'):
+        extension = '.' + extension
+
+    encoder = EncoderOptions(args.png_compression, args.jpeg_quality, args.progressive,
+                             args.optimize, args.webp_quality, args.webp_lossless)
+    tasks = [BatchTask(path, output_path_for(relative, args.output, args.suffix, extension),
+                       args.operation, options, encoder)
+             for path, relative in find_images(args.inputs, args.recursive)]
+    manifest = load_manifest(args.output)
+    pending = [task for task in tasks
+               if args.overwrite or not is_up_to_date(task, manifest, args.output)]
+    skipped = len(tasks) - len(pending)
+    print(f"{len(tasks)} images found, {skipped} already processed, {len(pending)} to do")
+
+    # Where each input goes, to record the settings of the outputs written
+    output_keys = {task.input_path: os.path.relpath(task.output_path, args.output)
+                   for task in pending}
+    signature = pending[0].signature() if pending else None
+    # Outputs about to be overwritten no longer match their recorded settings;
+    # forget them first so an interrupted run redoes them
+    for key in output_keys.values():
+        manifest.pop(key, None)
+    if pending:
+        save_manifest(args.output, manifest)
+
+    def report(result):
+        if result.status == 'done':
+            manifest[output_keys[result.input_path]] = signature
+            save_manifest(args.output, manifest)
+            memory = ''
+            if result.peak_bytes:
+                memory = f", peak {result.peak_bytes / (1024 * 1024):.0f} MB"
+            print(f"  done    {result.input_path} ({result.seconds:.2f}s{memory})")
+        else:
+            print(f"  failed  {result.input_path}: {result.error}")
+
+    start = time.perf_counter()
+    try:
+        results = run_batch(pending, args.workers, args.max_in_flight, report, args.scratch_dir)
+    finally:
+        if pending:
+            save_manifest(args.output, manifest)
+    elapsed = time.perf_counter() - start
+
+    # Throughput summary
+    done = [result for result in results if result.status == 'done']
+    failed = len(results) - len(done)
+    megapixels = sum(result.pixels for result in done) / 1e6
+    print(f"Processed {len(done)} images ({megapixels:.1f} MP) in {elapsed:.1f}s, "
+          f"{skipped} skipped, {failed} failed")
+    if done and elapsed > 0:
+        print(f"Throughput: {len(done) / elapsed:.2f} images/s, {megapixels / elapsed:.2f} MP/s")
+        output_mb = sum(result.output_bytes for result in done) / (1024 * 1024)
+        encode_seconds = sum(result.encode_seconds for result in done)
+        print(f"Output: {output_mb:.1f} MB, {encode_seconds:.1f}s spent encoding")
+        if args.trace_memory:
+            peak_mb = max(result.peak_bytes for result in done) / (1024 * 1024)
+            print(f"Peak allocation: {peak_mb:.0f} MB in one operation")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
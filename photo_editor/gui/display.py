@@ -0,0 +1,25 @@
+# photo_editor/gui/display.py
+
+class DisplayCache:
+    """
+    Display form of an image array (such as its ImagePyramid), rebuilt only
+    when the array changes.
+
+    Processing never edits arrays in place (results are new arrays, and
+    cached ones are read-only), so the identity of the array is enough to
+    know whether the display form is still current.
+    """
+    def __init__(self, build):
+        self.build = build  # array -> display object
+        self.source = None
+        self.value = None
+
+    def get(self, array):
+        if array is not self.source or self.value is None:
+            self.value = self.build(array)
+            self.source = array
+        return self.value
+
+    def clear(self):
+        self.source = None
+        self.value = None
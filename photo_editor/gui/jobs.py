@@ -0,0 +1,131 @@
+# photo_editor/gui/jobs.py
+import threading
+import traceback
+from collections import deque
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+from photo_editor.processing.image_operations import OperationCancelled
+
+class JobSignals(QObject):
+    """Signals a job emits from its worker thread"""
+    finished = Signal(object, object)  # job, result
+    failed = Signal(object, str)       # job, error message
+    cancelled = Signal(object)         # job
+
+class ProcessingJob(QRunnable):
+    """A processing call run on a worker thread, with cooperative cancellation"""
+    def __init__(self, func, *args, description="Processing...", cancel_event=None,
+                 cancellable=True, **kwargs):
+        super().__init__()
+        self.setAutoDelete(False)  # The engine owns the job until it reports back
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.description = description
+        # Shared with the code being run, which polls it between stages
+        self.cancel_event = cancel_event or threading.Event()
+        # False for jobs such as saves that cancel_all lets finish
+        self.cancellable = cancellable
+        self.is_cancelled = False
+        self.signals = JobSignals()
+
+    def cancel(self):
+        self.is_cancelled = True
+        self.cancel_event.set()
+
+    def run(self):
+        if self.is_cancelled:
+            self.signals.cancelled.emit(self)
+            return
+        self.cancel_event.clear()
+        try:
+            result = self.func(*self.args, **self.kwargs)
+        except OperationCancelled:
+            self.signals.cancelled.emit(self)
+        except Exception as e:
+            traceback.print_exc()
+            self.signals.failed.emit(self, str(e))
+        else:
+            # A job that ran to completion reports its result even if a
+            # cancel arrived too late to stop it
+            self.signals.finished.emit(self, result)
+
+class JobEngine(QObject):
+    """Runs processing jobs one at a time off the GUI thread, with a pending queue"""
+    job_started = Signal(object)
+    job_finished = Signal(object, object)
+    job_failed = Signal(object, str)
+    job_cancelled = Signal(object)
+    idle = Signal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)  # Jobs share the processor state, so run them serially
+        self.pending = deque()
+        self.active = None
+
+    def submit(self, func, *args, **kwargs):
+        """Queue func(*args, **kwargs) and return the job."""
+        job = ProcessingJob(func, *args, **kwargs)
+        job.signals.finished.connect(self._on_finished)
+        job.signals.failed.connect(self._on_failed)
+        job.signals.cancelled.connect(self._on_cancelled)
+        self.pending.append(job)
+        self._start_next()
+        return job
+
+    def pending_count(self):
+        return len(self.pending)
+
+    def is_busy(self):
+        return self.active is not None or bool(self.pending)
+
+    def cancel_current(self):
+        if self.active is not None and self.active.cancellable:
+            self.active.cancel()
+
+    def cancel_all(self):
+        """
+        Drop every pending job and ask the running one to stop. Uncancellable
+        jobs (saves) are kept, with the jobs ahead of them, which produce the
+        image they write; only what is queued after the last one is dropped.
+        """
+        jobs = list(self.pending)
+        keep = max((index + 1 for index, job in enumerate(jobs) if not job.cancellable),
+                   default=0)
+        self.pending = deque(jobs[:keep])
+        for job in jobs[keep:]:
+            job.cancel()
+            self.job_cancelled.emit(job)
+        if not self.pending:
+            self.cancel_current()
+        if not self.is_busy():
+            self.idle.emit()
+
+    def wait(self, msecs=-1):
+        return self.pool.waitForDone(msecs)
+
+    def _start_next(self):
+        if self.active is not None or not self.pending:
+            return
+        self.active = self.pending.popleft()
+        self.job_started.emit(self.active)
+        self.pool.start(self.active)
+
+    def _job_done(self):
+        self.active = None
+        self._start_next()
+        if self.active is None:
+            self.idle.emit()
+
+    def _on_finished(self, job, result):
+        self.job_finished.emit(job, result)
+        self._job_done()
+
+    def _on_failed(self, job, message):
+        self.job_failed.emit(job, message)
+        self._job_done()
+
+    def _on_cancelled(self, job):
+        self.job_cancelled.emit(job)
+        self._job_done()
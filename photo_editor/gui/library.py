@@ -0,0 +1,169 @@
+# photo_editor/gui/library.py
+import os
+import threading
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, QTimer, QFileSystemWatcher, Signal
+from photo_editor.processing.library_index import LibraryIndex
+
+def watchable_directories(roots, limit, stop_event=None):
+    """The roots and their non-hidden subdirectories in os.walk order, at most limit of them."""
+    directories = []
+    for root in roots:
+        for directory, subdirectories, _ in os.walk(root):
+            if stop_event is not None and stop_event.is_set():
+                return directories
+            subdirectories[:] = [name for name in subdirectories if not name.startswith('.')]
+            directories.append(directory)
+            if len(directories) >= limit:
+                return directories
+    return directories
+
+class ScanJob(QRunnable):
+    """
+    Rescan directories into the index on a worker thread. With watch, the
+    directories to watch below them are listed first and handed back to
+    the LibraryWatcher, so the walk never runs on the GUI thread.
+    """
+    def __init__(self, library, directories, recursive, watch=False):
+        super().__init__()
+        self.library = library
+        self.directories = directories
+        self.recursive = recursive
+        self.watch = watch
+
+    def run(self):
+        library = self.library
+        if self.watch:
+            watched = watchable_directories(self.directories, library.MAX_WATCHED_DIRECTORIES,
+                                            library.stop_event)
+            library.watch_list_ready.emit(list(self.directories), watched)
+        if self.scan(self.directories, self.recursive):
+            library.scan_finished.emit()
+
+    def scan(self, directories, recursive):
+        """Scan directories into the index; returns False if stopped."""
+        library = self.library
+        for directory in directories:
+            if library.stop_event.is_set():
+                return False
+            try:
+                library.index.scan(directory, recursive, library.stop_event)
+            except Exception as e:
+                print(f"Library scan of {directory} failed: {e}")
+        return True
+
+class ChangeScanJob(ScanJob):
+    """
+    Rescan directories the watcher reported as changed. A changed directory
+    is rescanned on its own; one that disappeared, or a new subdirectory
+    (which may arrive with its contents), is rescanned whole, and new
+    subdirectories are handed back to be watched.
+    """
+    def __init__(self, library, directories, watched):
+        super().__init__(library, directories, recursive=False)
+        self.watched = watched  # Directories watched when the changes were reported
+
+    def run(self):
+        library = self.library
+        changed, whole = [], []
+        for directory in self.directories:
+            if not os.path.isdir(directory):
+                whole.append(directory)  # Removed: drop everything that was below it
+                continue
+            changed.append(directory)
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if (entry.is_dir() and not entry.name.startswith('.')
+                                and entry.path not in self.watched):
+                            whole.append(entry.path)
+            except OSError as e:
+                print(f"Library scan of {directory} failed: {e}")
+        new_directories = [directory for directory in whole if os.path.isdir(directory)]
+        if new_directories:
+            library.watch_added.emit(new_directories)
+        if self.scan(whole, recursive=True) and self.scan(changed, recursive=False):
+            library.scan_finished.emit()
+
+class LibraryWatcher(QObject):
+    """
+    Keeps a LibraryIndex in step with the library roots.
+
+    Changed directories reported by QFileSystemWatcher are rescanned on
+    their own (debounced); a full background rescan on start-up and every
+    RESCAN_INTERVAL_MS catches anything the watcher missed, such as
+    directories past the watch limit.
+    """
+    scan_finished = Signal()  # Emitted from the worker thread, delivered queued
+    watch_list_ready = Signal(list, list)  # Roots and the directories to watch below them
+    watch_added = Signal(list)  # New directories found below changed ones
+
+    RESCAN_INTERVAL_MS = 10 * 60 * 1000
+    MAX_WATCHED_DIRECTORIES = 2000  # Watches are an OS resource (inotify on Linux)
+
+    def __init__(self, index=None, parent=None):
+        super().__init__(parent)
+        self.index = index or LibraryIndex()
+        self.roots = []
+        self.stop_event = threading.Event()
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)  # Scans are I/O bound; one at a time keeps the disk calm
+
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.directory_changed)
+        self.changed_directories = set()
+        self.change_timer = QTimer(self)
+        self.change_timer.setSingleShot(True)
+        self.change_timer.timeout.connect(self.scan_changed)
+        self.rescan_timer = QTimer(self)
+        self.rescan_timer.timeout.connect(self.rescan)
+        self.rescan_timer.start(self.RESCAN_INTERVAL_MS)
+        self.watch_list_ready.connect(self.watch_directories)
+        self.watch_added.connect(self.add_watches)
+
+    def set_roots(self, roots):
+        roots = [os.path.abspath(root) for root in roots if os.path.isdir(root)]
+        for root in set(self.roots) - set(roots):
+            self.index.remove_root(root)
+        self.roots = roots
+        self.rescan()
+
+    def watch_directories(self, roots, directories):
+        """Replace the watched directories with those a ScanJob listed."""
+        if roots != self.roots:
+            return  # Listed for roots that have since changed
+        watched = self.watcher.directories()
+        if watched:
+            self.watcher.removePaths(watched)
+        if directories:
+            self.watcher.addPaths(directories)
+
+    def rescan(self):
+        """Rescan every root in the background, refreshing the watched directories too."""
+        if self.roots:
+            self.pool.start(ScanJob(self, list(self.roots), recursive=True, watch=True))
+        else:
+            self.watch_directories([], [])
+
+    def directory_changed(self, path):
+        self.changed_directories.add(path)
+        self.change_timer.start(500)
+
+    def add_watches(self, directories):
+        watched = set(self.watcher.directories())
+        directories = [directory for directory in directories if directory not in watched]
+        if directories:
+            self.watcher.addPaths(directories)
+
+    def scan_changed(self):
+        # Listing the directories touches the disk, so it happens on the worker too
+        directories = sorted(self.changed_directories)
+        self.changed_directories.clear()
+        if directories:
+            self.pool.start(ChangeScanJob(self, directories, set(self.watcher.directories())))
+
+    def search(self, text, limit=500):
+        return self.index.search(text, limit)
+
+    def stop(self):
+        self.stop_event.set()
+        self.pool.waitForDone()
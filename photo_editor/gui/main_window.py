@@ -72,6 +72,14 @@ class PhotoEditorWindow(QMainWindow):
         
         # Connect file navigator to image viewer
         self.file_navigator.file_selected.connect(self.image_viewer.load_image)
+        self.file_navigator.prefetch_requested.connect(self.image_viewer.prefetch)
+        
+    def closeEvent(self, event):
+        # Let thumbnail and library workers finish their current file before exiting
+        self.file_navigator.thumbnail_loader.stop()
+        self.file_navigator.library.stop()
+        self.image_viewer.prefetcher.stop()
+        super().closeEvent(event)
         
     def resizeEvent(self, event):
         """Handle window resize events"""
@@ -0,0 +1,58 @@
+# photo_editor/gui/prefetch.py
+import threading
+from collections import deque
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+
+class PrefetchWorker(QRunnable):
+    """Decodes queued paths into the cache until the queue is empty"""
+    def __init__(self, prefetcher):
+        super().__init__()
+        self.prefetcher = prefetcher
+
+    def run(self):
+        while True:
+            path = self.prefetcher.next_path()
+            if path is None:
+                return
+            try:
+                self.prefetcher.decode_cache.load(path)
+            except Exception:
+                continue  # The foreground load reports unreadable files
+            self.prefetcher.decoded.emit(path)
+
+class Prefetcher(QObject):
+    """
+    Decodes files the user is likely to open next into a DecodeCache.
+
+    Each request replaces the queue, so moving quickly through a folder
+    only decodes the neighbours of where the selection ended up.
+    """
+    decoded = Signal(str)  # Emitted from worker threads, delivered queued
+
+    def __init__(self, decode_cache, parent=None, threads=2):
+        super().__init__(parent)
+        self.decode_cache = decode_cache
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(threads)
+        self.queue = deque()
+        self.workers = 0
+        self._lock = threading.Lock()
+
+    def prefetch(self, paths):
+        with self._lock:
+            self.queue = deque(path for path in paths if self.decode_cache.get(path) is None)
+            new_workers = max(0, min(len(self.queue), self.pool.maxThreadCount() - self.workers))
+            self.workers += new_workers
+        for _ in range(new_workers):
+            self.pool.start(PrefetchWorker(self))
+
+    def next_path(self):
+        with self._lock:
+            if not self.queue:
+                self.workers -= 1
+                return None
+            return self.queue.popleft()
+
+    def stop(self):
+        self.prefetch([])
+        self.pool.waitForDone()
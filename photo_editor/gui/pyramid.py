@@ -0,0 +1,84 @@
+# photo_editor/gui/pyramid.py
+import math
+from collections import OrderedDict
+import cv2
+from PySide6.QtGui import QPixmap
+
+class ImagePyramid:
+    """
+    Mipmap pyramid of an image for display, built once per image.
+
+    Level 0 is the full-resolution array and each level above it halves
+    both dimensions. Whole levels are converted to pixmaps only when they
+    are small; deep zoom draws fixed-size tiles of the nearest level, so a
+    gigapixel result never has to be converted in one piece.
+    """
+    TILE_SIZE = 512
+    MAX_TILES = 256            # Cached tile pixmaps, least recently drawn evicted first
+    WHOLE_LEVEL_PIXELS = 4_000_000  # Largest level converted as a single pixmap
+
+    def __init__(self, array, to_qimage, min_size=128):
+        self.to_qimage = to_qimage  # e.g. ImageProcessor.get_qt_image
+        self.levels = [array]
+        while max(self.levels[-1].shape[:2]) > min_size:
+            previous = self.levels[-1]
+            size = (max(1, previous.shape[1] // 2), max(1, previous.shape[0] // 2))
+            self.levels.append(cv2.resize(previous, size, interpolation=cv2.INTER_AREA))
+        self.level_pixmaps = {}
+        self.tiles = OrderedDict()
+
+    @property
+    def width(self):
+        return self.levels[0].shape[1]
+
+    @property
+    def height(self):
+        return self.levels[0].shape[0]
+
+    def level_scale(self, level):
+        """Size of a level relative to full resolution."""
+        return self.levels[level].shape[1] / self.width
+
+    def level_for_scale(self, scale):
+        """Smallest level that still has at least scale x full-resolution detail."""
+        if scale >= 1:
+            return 0
+        level = int(math.floor(math.log2(1 / scale)))
+        return min(level, len(self.levels) - 1)
+
+    def level_pixmap(self, level):
+        """Pixmap of a whole level, or None if the level is too large to convert at once."""
+        array = self.levels[level]
+        if array.shape[0] * array.shape[1] > self.WHOLE_LEVEL_PIXELS:
+            return None
+        if level not in self.level_pixmaps:
+            self.level_pixmaps[level] = QPixmap.fromImage(self.to_qimage(array))
+        return self.level_pixmaps[level]
+
+    def tile(self, level, column, row):
+        """Pixmap of one tile of a level, converted on first use."""
+        key = (level, column, row)
+        pixmap = self.tiles.get(key)
+        if pixmap is not None:
+            self.tiles.move_to_end(key)
+            return pixmap
+
+        size = self.TILE_SIZE
+        array = self.levels[level][row * size:(row + 1) * size,
+                                   column * size:(column + 1) * size]
+        pixmap = QPixmap.fromImage(self.to_qimage(array))
+        self.tiles[key] = pixmap
+        while len(self.tiles) > self.MAX_TILES:
+            self.tiles.popitem(last=False)
+        return pixmap
+
+    def visible_tiles(self, level, left, top, right, bottom):
+        """Yield (column, row) of the tiles of a level overlapping a rectangle in level pixels."""
+        array = self.levels[level]
+        size = self.TILE_SIZE
+        first_column, first_row = max(0, int(left) // size), max(0, int(top) // size)
+        last_column = min((array.shape[1] - 1) // size, int(math.ceil(right)) // size)
+        last_row = min((array.shape[0] - 1) // size, int(math.ceil(bottom)) // size)
+        for row in range(first_row, last_row + 1):
+            for column in range(first_column, last_column + 1):
+                yield column, row
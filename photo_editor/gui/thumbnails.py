@@ -0,0 +1,120 @@
+# photo_editor/gui/thumbnails.py
+import threading
+from collections import OrderedDict, deque
+from PySide6.QtCore import Qt, QObject, QRunnable, QThreadPool, QThread, Signal, QIdentityProxyModel
+from PySide6.QtGui import QImage, QPixmap
+from photo_editor.processing.thumbnails import ThumbnailCache
+
+def thumbnail_qimage(array):
+    """Owned QImage copy of a BGR or grayscale thumbnail, safe to pass between threads."""
+    height, width = array.shape[:2]
+    format = QImage.Format_Grayscale8 if array.ndim == 2 else QImage.Format_BGR888
+    return QImage(array.data, width, height, array.strides[0], format).copy()
+
+class ThumbnailWorker(QRunnable):
+    """Takes paths from the loader's queue until it is empty"""
+    def __init__(self, loader):
+        super().__init__()
+        self.loader = loader
+
+    def run(self):
+        loader = self.loader
+        while True:
+            path = loader.next_path()
+            if path is None:
+                return
+            try:
+                thumbnail = loader.cache.load(path)
+            except Exception:
+                thumbnail = None
+            image = thumbnail_qimage(thumbnail) if thumbnail is not None else QImage()
+            loader.finish_path(path)
+            loader.thumbnail_ready.emit(path, image)
+
+class ThumbnailLoader(QObject):
+    """
+    Generates thumbnails on a worker pool in the order they were last requested.
+
+    Each request replaces the queue, so while scrolling only the rows on
+    screen (and just past it) are decoded; a null QImage reports a file
+    that could not be read.
+    """
+    thumbnail_ready = Signal(str, QImage)  # Emitted from worker threads, delivered queued
+
+    def __init__(self, cache=None, parent=None):
+        super().__init__(parent)
+        self.cache = cache or ThumbnailCache()
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max(1, min(4, QThread.idealThreadCount())))
+        self.queue = deque()
+        self.loading = set()
+        self.workers = 0
+        self._lock = threading.Lock()
+
+    def request(self, paths):
+        """Load these paths next, in order, dropping anything requested earlier."""
+        with self._lock:
+            self.queue = deque(path for path in paths if path not in self.loading)
+            new_workers = min(len(self.queue), self.pool.maxThreadCount() - self.workers)
+            self.workers += max(0, new_workers)
+        for _ in range(new_workers):
+            self.pool.start(ThumbnailWorker(self))
+
+    def next_path(self):
+        with self._lock:
+            if not self.queue:
+                self.workers -= 1
+                return None
+            path = self.queue.popleft()
+            self.loading.add(path)
+            return path
+
+    def finish_path(self, path):
+        with self._lock:
+            self.loading.discard(path)
+
+    def stop(self):
+        self.request([])
+        self.pool.waitForDone()
+
+class ThumbnailModel(QIdentityProxyModel):
+    """
+    QFileSystemModel proxy whose icons are the generated thumbnails.
+
+    Keeps a bounded set of pixmaps in memory; rows without one show the
+    file system icon until the loader delivers it.
+    """
+    MAX_PIXMAPS = 1000
+
+    def __init__(self, loader, parent=None):
+        super().__init__(parent)
+        self.loader = loader
+        self.pixmaps = OrderedDict()  # path -> QPixmap, least recently shown first
+        self.unreadable = set()
+        loader.thumbnail_ready.connect(self.on_thumbnail_ready)
+
+    def file_path(self, index):
+        return self.sourceModel().filePath(self.mapToSource(index))
+
+    def needs_thumbnail(self, path):
+        return path not in self.pixmaps and path not in self.unreadable
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DecorationRole and index.column() == 0:
+            path = self.file_path(index)
+            pixmap = self.pixmaps.get(path)
+            if pixmap is not None:
+                self.pixmaps.move_to_end(path)
+                return pixmap
+        return super().data(index, role)
+
+    def on_thumbnail_ready(self, path, image):
+        if image.isNull():
+            self.unreadable.add(path)
+            return
+        self.pixmaps[path] = QPixmap.fromImage(image)
+        while len(self.pixmaps) > self.MAX_PIXMAPS:
+            self.pixmaps.popitem(last=False)
+        index = self.mapFromSource(self.sourceModel().index(path))
+        if index.isValid():
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])
@@ -1,17 +1,39 @@
 import os
 import json
+import numpy as np
+from dataclasses import replace
 from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, 
                             QPushButton, QTreeView, QInputDialog, QFileDialog,
                             QFileSystemModel, QComboBox, QLineEdit, QMenu,
                             QMessageBox, QSplitter, QFrame, QApplication,
-                            QProgressBar, QDialog, QSlider, QGroupBox)
-from PySide6.QtCore import Qt, QDir, Signal, QTimer, QPoint, QRect, QSize, QMimeData
+                            QProgressBar, QDialog, QSlider, QGroupBox, QListWidget,
+                            QListWidgetItem, QListView, QStackedWidget, QCheckBox,
+                            QSpinBox)
+from PySide6.QtCore import (Qt, QDir, Signal, QTimer, QPoint, QPointF, QRect, QRectF,
+                           QSize, QMimeData, QElapsedTimer)
 from PySide6.QtGui import (QPixmap, QImage, QAction, QDrag, QMouseEvent, 
-                          QPainter, QColor, QPen)
-from photo_editor.processing.image_operations import ImageProcessor, SegmentationParams
+                          QPainter, QColor, QPen, QKeySequence, QPolygonF)
+from photo_editor.processing.image_operations import (ImageProcessor, SegmentationParams,
+                                                      SEGMENTATION_PRESETS)
+from photo_editor.processing.proxy import make_proxy, scale_segmentation_params, PREVIEW_PIXELS
+from photo_editor.gui.jobs import JobEngine
+from photo_editor.gui.display import DisplayCache
+from photo_editor.gui.pyramid import ImagePyramid
+from photo_editor.processing.tracing import CallbackSink
+from photo_editor.processing.backing_store import BackingStore
+from photo_editor.processing.encoding import EncoderOptions, SaveResult
+from photo_editor.processing.color_lut import ColorPalette
+from photo_editor.processing.superpixels import SUPERPIXEL_BACKENDS, has_ximgproc, resolve_backend
+from photo_editor.processing.selection import Selection, SELECTION_SHAPES
+from photo_editor.gui.thumbnails import ThumbnailLoader, ThumbnailModel
+from photo_editor.gui.library import LibraryWatcher
+from photo_editor.gui.prefetch import Prefetcher
 
 class FileNavigator(QWidget):
     file_selected = Signal(str)
+    prefetch_requested = Signal(list)  # Files likely to be opened next, most likely first
+    
+    PREFETCH_NEIGHBOURS = 2  # Files decoded ahead on each side of the selection
     
     def __init__(self, start_path=None):
         super().__init__()
@@ -47,12 +69,24 @@ class FileNavigator(QWidget):
         # Set the starting directory
         self.file_system.setRootPath(self.start_path)
         
+        # View mode buttons
+        view_layout = QHBoxLayout()
+        self.grid_button = QPushButton("Thumbnails")
+        self.grid_button.setCheckable(True)
+        self.grid_button.toggled.connect(self.set_grid_mode)
+        view_layout.addWidget(self.grid_button)
+        self.up_button = QPushButton("Up")
+        self.up_button.clicked.connect(self.go_up)
+        view_layout.addWidget(self.up_button)
+        layout.addLayout(view_layout)
+        
         # Create tree view
         self.tree_view = QTreeView()
         self.tree_view.setModel(self.file_system)
         self.tree_view.setRootIndex(self.file_system.index(self.start_path))
         self.tree_view.setContextMenuPolicy(Qt.CustomContextMenu)
         self.tree_view.customContextMenuRequested.connect(self.show_context_menu)
+        self.root_path = self.start_path
         
         # Configure view
         self.tree_view.setColumnWidth(0, 200)
@@ -64,10 +98,50 @@ class FileNavigator(QWidget):
         self.file_system.setNameFilters(['*.jpg', '*.jpeg', '*.png', '*.bmp', '*.gif'])
         self.file_system.setNameFilterDisables(False)
         
-        # Connect selection signal
-        self.tree_view.clicked.connect(self.on_file_selected)
-        
-        layout.addWidget(self.tree_view)
+        # Connect selection signal; keyboard navigation selects too
+        self.tree_view.selectionModel().currentChanged.connect(self.on_file_selected)
+        
+        # Thumbnail grid over the same model; thumbnails come from the disk
+        # cache or are generated in the background, visible rows first
+        self.thumbnail_loader = ThumbnailLoader(parent=self)
+        self.thumbnail_model = ThumbnailModel(self.thumbnail_loader, self)
+        self.thumbnail_model.setSourceModel(self.file_system)
+        self.grid_view = QListView()
+        self.grid_view.setModel(self.thumbnail_model)
+        self.grid_view.setViewMode(QListView.IconMode)
+        self.grid_view.setIconSize(QSize(128, 128))
+        self.grid_view.setGridSize(QSize(148, 168))
+        self.grid_view.setResizeMode(QListView.Adjust)
+        self.grid_view.setMovement(QListView.Static)
+        self.grid_view.setUniformItemSizes(True)
+        self.grid_view.setWordWrap(True)
+        self.grid_view.setRootIndex(self.thumbnail_model.mapFromSource(
+            self.file_system.index(self.start_path)))
+        self.grid_view.selectionModel().currentChanged.connect(self.on_grid_selected)
+        self.grid_view.doubleClicked.connect(self.on_grid_double_clicked)
+        
+        # Re-prioritise thumbnails shortly after scrolling, resizing or a directory load
+        self.thumbnail_timer = QTimer()
+        self.thumbnail_timer.setSingleShot(True)
+        self.thumbnail_timer.timeout.connect(self.request_visible_thumbnails)
+        self.grid_view.verticalScrollBar().valueChanged.connect(self.schedule_thumbnails)
+        self.grid_view.verticalScrollBar().rangeChanged.connect(self.schedule_thumbnails)
+        self.file_system.directoryLoaded.connect(self.schedule_thumbnails)
+        
+        # Search results from the library index
+        self.search_results = QListWidget()
+        self.search_results.currentItemChanged.connect(self.on_search_result_selected)
+        
+        self.view_stack = QStackedWidget()
+        self.view_stack.addWidget(self.tree_view)
+        self.view_stack.addWidget(self.grid_view)
+        self.view_stack.addWidget(self.search_results)
+        layout.addWidget(self.view_stack)
+        
+        # Index of the favourite locations (and the start folder), kept current in the background
+        self.library = LibraryWatcher(parent=self)
+        self.library.scan_finished.connect(self.perform_search)
+        self.update_library_roots()
         
         # Favorites Section
         favorites_label = QLabel("Favorites")
@@ -98,24 +172,93 @@ class FileNavigator(QWidget):
     def quick_access_changed(self, index):
         if index > 0:  # 0 is the placeholder text
             path = self.quick_access.currentData()
-            self.tree_view.setRootIndex(self.file_system.index(path))
+            self.set_root_path(path)
+            
+    def set_root_path(self, path):
+        """Show a directory in both the tree and the thumbnail grid"""
+        self.root_path = path
+        index = self.file_system.index(path)
+        self.tree_view.setRootIndex(index)
+        self.grid_view.setRootIndex(self.thumbnail_model.mapFromSource(index))
+        self.schedule_thumbnails()
+        
+    def go_up(self):
+        parent = os.path.dirname(os.path.normpath(self.root_path))
+        if parent and parent != self.root_path:
+            self.set_root_path(parent)
+            
+    def set_grid_mode(self, enabled):
+        self.search_bar.clear()
+        self.view_stack.setCurrentWidget(self.grid_view if enabled else self.tree_view)
+        if enabled:
+            self.schedule_thumbnails()
+        else:
+            self.thumbnail_loader.request([])
+            
+    def schedule_thumbnails(self, *args):
+        if self.view_stack.currentWidget() is self.grid_view:
+            self.thumbnail_timer.start(50)
+            
+    def request_visible_thumbnails(self):
+        """Queue thumbnails for the rows on screen, then the next screenful"""
+        root = self.grid_view.rootIndex()
+        viewport = self.grid_view.viewport().rect()
+        visible, following = [], []
+        visible_rows = first_hidden = 0
+        for row in range(self.thumbnail_model.rowCount(root)):
+            index = self.thumbnail_model.index(row, 0, root)
+            rect = self.grid_view.visualRect(index)
+            if rect.bottom() < viewport.top():
+                continue
+            if rect.top() > viewport.bottom():
+                # Prefetch as many items below the fold as are on screen
+                if row >= first_hidden + visible_rows:
+                    break
+                target = following
+            else:
+                visible_rows += 1
+                first_hidden = row + 1
+                target = visible
+            path = self.thumbnail_model.file_path(index)
+            if not os.path.isdir(path) and self.thumbnail_model.needs_thumbnail(path):
+                target.append(path)
+        self.thumbnail_loader.request(visible + following)
+        
+    def on_grid_selected(self, index):
+        path = self.thumbnail_model.file_path(index)
+        if not os.path.isdir(path):
+            self.file_selected.emit(path)
+            self.prefetch_requested.emit(
+                self.neighbour_paths(self.thumbnail_model, index, self.thumbnail_model.file_path))
+            
+    def on_grid_double_clicked(self, index):
+        path = self.thumbnail_model.file_path(index)
+        if os.path.isdir(path):
+            self.set_root_path(path)
             
     def search_text_changed(self):
         """Start timer for search delay"""
         self.search_timer.start(300)  # 300ms delay
         
     def perform_search(self):
-        """Perform the actual search"""
-        search_text = self.search_bar.text().lower()
+        """Search the library index by name, folder or camera"""
+        search_text = self.search_bar.text().strip()
         if not search_text:
             # Reset to normal view
-            self.file_system.setNameFilters(['*.jpg', '*.jpeg', '*.png', '*.bmp', '*.gif'])
+            self.view_stack.setCurrentWidget(
+                self.grid_view if self.grid_button.isChecked() else self.tree_view)
             return
             
-        # Add search term to name filters
-        self.file_system.setNameFilters([f'*{search_text}*.jpg', f'*{search_text}*.jpeg',
-                                       f'*{search_text}*.png', f'*{search_text}*.bmp',
-                                       f'*{search_text}*.gif'])
+        self.search_results.clear()
+        for path in self.library.search(search_text):
+            item = QListWidgetItem(os.path.basename(path))
+            item.setData(Qt.UserRole, path)
+            item.setToolTip(path)
+            self.search_results.addItem(item)
+        self.view_stack.setCurrentWidget(self.search_results)
+        
+    def update_library_roots(self):
+        self.library.set_roots(self.favorites + [self.start_path])
         
     def show_context_menu(self, position):
         """Show context menu for adding/removing favorites"""
@@ -160,6 +303,7 @@ class FileNavigator(QWidget):
             self.favorites.append(path)
             self.save_favorites()
             self.update_favorites_combo()
+            self.update_library_roots()
             QMessageBox.information(self, "Success", "Location added to favorites!")
             
     def remove_favorite(self, path):
@@ -168,6 +312,7 @@ class FileNavigator(QWidget):
             self.favorites.remove(path)
             self.save_favorites()
             self.update_favorites_combo()
+            self.update_library_roots()
             QMessageBox.information(self, "Success", "Location removed from favorites!")
             
     def favorite_selected(self, index):
@@ -175,14 +320,42 @@ class FileNavigator(QWidget):
         if index > 0:  # 0 is the placeholder text
             path = self.favorites_combo.currentData()
             if os.path.exists(path):
-                self.tree_view.setRootIndex(self.file_system.index(path))
+                self.set_root_path(path)
             else:
                 QMessageBox.warning(self, "Error", "Selected location no longer exists!")
                 self.remove_favorite(path)
                 
     def on_file_selected(self, index):
         file_path = self.file_system.filePath(index)
-        self.file_selected.emit(file_path)
+        if os.path.isfile(file_path):
+            self.file_selected.emit(file_path)
+            self.prefetch_requested.emit(
+                self.neighbour_paths(self.file_system, index, self.file_system.filePath))
+            
+    def on_search_result_selected(self, item):
+        if item is None:
+            return
+        self.file_selected.emit(item.data(Qt.UserRole))
+        row = self.search_results.row(item)
+        neighbours = []
+        for distance in range(1, self.PREFETCH_NEIGHBOURS + 1):
+            for neighbour in (row + distance, row - distance):
+                if 0 <= neighbour < self.search_results.count():
+                    neighbours.append(self.search_results.item(neighbour).data(Qt.UserRole))
+        self.prefetch_requested.emit(neighbours)
+        
+    def neighbour_paths(self, model, index, path_of):
+        """Files next to index in its folder, nearest first and the next one before the previous"""
+        parent = index.parent()
+        rows = model.rowCount(parent)
+        paths = []
+        for distance in range(1, self.PREFETCH_NEIGHBOURS + 1):
+            for row in (index.row() + distance, index.row() - distance):
+                if 0 <= row < rows:
+                    path = path_of(model.index(row, 0, parent))
+                    if os.path.isfile(path):
+                        paths.append(path)
+        return paths
 
 class DropIndicatorOverlay(QWidget):
     def __init__(self, parent=None):
@@ -247,6 +420,8 @@ class DropZoneOverlay(QWidget):
             painter.drawText(self.rect(), Qt.AlignCenter, text)
 
 class ProcessingOverlay(QWidget):
+    cancel_requested = Signal()
+    
     def __init__(self, parent=None):
         super().__init__(parent)
         self.init_ui()
@@ -286,11 +461,66 @@ class ProcessingOverlay(QWidget):
             }
         """)
 
+        # Create stage label, updated live while an operation runs
+        self.stage_label = QLabel("")
+        self.stage_label.setStyleSheet("""
+            QLabel {
+                color: #333;
+                background-color: rgba(255, 255, 255, 220);
+                padding: 3px;
+                border-radius: 3px;
+            }
+        """)
+        self.stage_name = ""
+        self.run_timer = QElapsedTimer()
+        self.stage_timer = QElapsedTimer()
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(100)
+        self.refresh_timer.timeout.connect(self.refresh_stage)
+
+        # Create cancel button
+        self.cancel_btn = QPushButton("Cancel")
+        self.cancel_btn.setFixedWidth(100)
+        self.cancel_btn.clicked.connect(self.cancel_requested)
+
         layout.addWidget(self.status_label, alignment=Qt.AlignCenter)
         layout.addWidget(self.progress, alignment=Qt.AlignCenter)
+        layout.addWidget(self.stage_label, alignment=Qt.AlignCenter)
+        layout.addWidget(self.cancel_btn, alignment=Qt.AlignCenter)
+        self.stage_label.hide()
 
     def set_status(self, text):
         self.status_label.setText(text)
+        
+    def start_run(self):
+        """Start the elapsed-time display for a new operation"""
+        self.stage_name = ""
+        self.run_timer.start()
+        self.stage_timer.start()
+        self.stage_label.setText("")
+        self.stage_label.show()
+        self.refresh_timer.start()
+        
+    def stop_run(self):
+        self.refresh_timer.stop()
+        self.stage_label.hide()
+        
+    def set_stage(self, name):
+        self.stage_name = name
+        self.stage_timer.start()
+        self.refresh_stage()
+        
+    def refresh_stage(self):
+        total = self.run_timer.elapsed() / 1000
+        if self.stage_name:
+            stage = self.stage_timer.elapsed() / 1000
+            self.stage_label.setText(f"{self.stage_name}: {stage:.1f}s (total {total:.1f}s)")
+        else:
+            self.stage_label.setText(f"{total:.1f}s")
+        
+    def set_cancellable(self, cancellable):
+        self.cancel_btn.setEnabled(cancellable)
+        self.cancel_btn.setVisible(cancellable)
 
     def paintEvent(self, event):
         painter = QPainter(self)
@@ -299,6 +529,8 @@ class ProcessingOverlay(QWidget):
 class DraggableImageLabel(QLabel):
     dragStarted = Signal(QPoint)
     dropped = Signal(QPoint)
+    detail_requested = Signal()  # Zoomed past the resolution of the shown image
+    selection_drawn = Signal(str, list)  # Shape and its points, relative to the image size
     
     def __init__(self, title: str):
         super().__init__(title)
@@ -309,6 +541,17 @@ class DraggableImageLabel(QLabel):
         self.drag_start_position = None
         self.original_pixmap = None
         self.is_dragging = False  # Initialize is_dragging attribute
+        
+        # Image pyramid and view state; zoom None means fit to the label
+        self.pyramid = None
+        self.zoom = None
+        self.center = QPointF()
+        self.pan_start = None
+        
+        # Left-drag draws this selection shape instead of reordering the views; None reorders
+        self.selection_shape = None
+        self.selection = None  # Selection outlined over the image
+        self.drawing = None    # Relative points of the selection being drawn
 
         self.setStyleSheet("""
             DraggableImageLabel {
@@ -323,13 +566,186 @@ class DraggableImageLabel(QLabel):
         
         self.setScaledContents(False)  # We'll handle scaling manually
 
+    def set_pyramid(self, pyramid):
+        """
+        Show an ImagePyramid, keeping zoom and pan if it has the same shape
+        (such as the full-resolution image replacing a preview).
+        """
+        previous = self.pyramid
+        self.pyramid = pyramid
+        if previous is None or pyramid is None:
+            self.reset_view()
+            return
+        ratio = pyramid.width / previous.width
+        if abs(previous.height * ratio - pyramid.height) > ratio:
+            self.reset_view()
+            return
+        if self.zoom is not None:
+            self.zoom /= ratio
+        self.center = self.center * ratio
+        self.update()
+        
+    def reset_view(self):
+        """Go back to fitting the whole image in the label"""
+        self.zoom = None
+        if self.pyramid is not None:
+            self.center = QPointF(self.pyramid.width / 2, self.pyramid.height / 2)
+        self.update()
+        
+    def fit_scale(self):
+        area = self.contentsRect()
+        return min(area.width() / self.pyramid.width, area.height() / self.pyramid.height)
+        
+    def view_scale(self):
+        """Screen pixels per full-resolution image pixel"""
+        return self.fit_scale() if self.zoom is None else self.zoom
+        
+    def image_rect(self):
+        """Where the full image lands in widget coordinates"""
+        scale = self.view_scale()
+        center = QRectF(self.contentsRect()).center()
+        if self.zoom is None:
+            left = center.x() - self.pyramid.width * scale / 2
+            top = center.y() - self.pyramid.height * scale / 2
+        else:
+            left = center.x() - self.center.x() * scale
+            top = center.y() - self.center.y() * scale
+        return QRectF(left, top, self.pyramid.width * scale, self.pyramid.height * scale)
+        
+    def widget_to_image(self, pos):
+        """Map a widget position to full-resolution image coordinates"""
+        rect = self.image_rect()
+        scale = self.view_scale()
+        return QPointF((pos.x() - rect.left()) / scale, (pos.y() - rect.top()) / scale)
+        
+    def widget_to_relative(self, pos):
+        """Map a widget position to image coordinates relative to its size, clamped to 0..1"""
+        point = self.widget_to_image(pos)
+        return (min(max(point.x() / self.pyramid.width, 0.0), 1.0),
+                min(max(point.y() / self.pyramid.height, 0.0), 1.0))
+        
+    def set_selection(self, selection):
+        self.selection = selection
+        self.update()
+        
+    def selection_outline(self):
+        """Polygon of the selection being drawn, or else the current one, in widget coordinates"""
+        if self.drawing is not None:
+            points = self.drawing
+            if self.selection_shape == 'rectangle':
+                (left, top), (right, bottom) = points[0], points[-1]
+                points = [(left, top), (right, top), (right, bottom), (left, bottom)]
+        elif self.selection is not None:
+            points = self.selection.points
+        else:
+            return None
+        rect = self.image_rect()
+        return QPolygonF([QPointF(rect.left() + x * rect.width(), rect.top() + y * rect.height())
+                          for x, y in points])
+        
+    def paintEvent(self, event):
+        if self.pyramid is None:
+            super().paintEvent(event)
+            return
+        
+        # Frame and background only; the title text is replaced by the image
+        QFrame.paintEvent(self, event)
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        painter.setClipRect(self.contentsRect())
+        
+        # Draw from the nearest pyramid level with enough detail
+        scale = self.view_scale()
+        level = self.pyramid.level_for_scale(scale)
+        level_scale = self.pyramid.level_scale(level)
+        rect = self.image_rect()
+        
+        pixmap = self.pyramid.level_pixmap(level)
+        if pixmap is not None:
+            painter.drawPixmap(rect, pixmap, QRectF(pixmap.rect()))
+        else:
+            # Only upload the tiles that are on screen
+            visible = rect.intersected(QRectF(self.contentsRect()))
+            factor = level_scale / scale  # level pixels per screen pixel
+            left = (visible.left() - rect.left()) * factor
+            top = (visible.top() - rect.top()) * factor
+            right = (visible.right() - rect.left()) * factor
+            bottom = (visible.bottom() - rect.top()) * factor
+            tile_size = self.pyramid.TILE_SIZE
+            for column, row in self.pyramid.visible_tiles(level, left, top, right, bottom):
+                tile = self.pyramid.tile(level, column, row)
+                target = QRectF(rect.left() + column * tile_size / factor,
+                                rect.top() + row * tile_size / factor,
+                                tile.width() / factor, tile.height() / factor)
+                painter.drawPixmap(target, tile, QRectF(tile.rect()))
+        
+        # Selection outline
+        outline = self.selection_outline()
+        if outline is not None:
+            painter.setPen(QPen(QColor(0, 120, 212), 2, Qt.DashLine))
+            painter.drawPolygon(outline)
+        painter.end()
+        
+    def wheelEvent(self, event):
+        """Zoom around the cursor"""
+        if self.pyramid is None:
+            return
+        anchor = self.widget_to_image(event.position())
+        steps = event.angleDelta().y() / 120
+        zoom = self.view_scale() * (1.25 ** steps)
+        zoom = max(self.fit_scale(), min(zoom, 32.0))
+        if zoom <= self.fit_scale():
+            self.reset_view()
+            return
+        # Keep the image point under the cursor in place
+        offset = event.position() - QRectF(self.contentsRect()).center()
+        self.zoom = zoom
+        self.center = QPointF(anchor.x() - offset.x() / zoom, anchor.y() - offset.y() / zoom)
+        self.update()
+        if zoom > 1:
+            self.detail_requested.emit()
+        
+    def mouseDoubleClickEvent(self, event):
+        self.reset_view()
+        
     def mousePressEvent(self, event: QMouseEvent):
+        if event.button() in (Qt.RightButton, Qt.MiddleButton) and self.zoom is not None:
+            # Pan with the right or middle button; left-drag still reorders the views
+            self.pan_start = (event.position(), QPointF(self.center))
+            self.setCursor(Qt.SizeAllCursor)
+            return
+        if event.button() == Qt.LeftButton and self.selection_shape and self.pyramid is not None:
+            self.drawing = [self.widget_to_relative(event.position())]
+            return
         if event.button() == Qt.LeftButton:
             self.drag_start_position = event.pos()
             self.setCursor(Qt.ClosedHandCursor)
             self.is_dragging = False  # Reset dragging state
 
+    def mouseReleaseEvent(self, event: QMouseEvent):
+        if self.drawing is not None:
+            points, self.drawing = self.drawing, None
+            self.selection_drawn.emit(self.selection_shape, points)
+            self.update()
+        if self.pan_start is not None:
+            self.pan_start = None
+            self.setCursor(Qt.ArrowCursor)
+        
     def mouseMoveEvent(self, event: QMouseEvent):
+        if self.pan_start is not None:
+            start_pos, start_center = self.pan_start
+            delta = (event.position() - start_pos) / self.zoom
+            self.center = start_center - delta
+            self.update()
+            return
+        if self.drawing is not None:
+            point = self.widget_to_relative(event.position())
+            if self.selection_shape == 'rectangle':
+                self.drawing[1:] = [point]
+            else:
+                self.drawing.append(point)
+            self.update()
+            return
         if not (event.buttons() & Qt.LeftButton):
             return
         if not self.drag_start_position:
@@ -397,6 +813,8 @@ class DraggableImageLabel(QLabel):
         """)
 
 class ImageViewerContainer(QWidget):
+    selection_drawn = Signal(str, list)  # From either label
+    
     def __init__(self):
         super().__init__()
         # Initialize state variables first
@@ -435,6 +853,8 @@ class ImageViewerContainer(QWidget):
         self.original_label.dropped.connect(self.handle_drop)
         self.edited_label.dragStarted.connect(self.handle_drag_start)
         self.edited_label.dropped.connect(self.handle_drop)
+        self.original_label.selection_drawn.connect(self.selection_drawn)
+        self.edited_label.selection_drawn.connect(self.selection_drawn)
         
         # Add labels to splitter
         self.splitter.addWidget(self.original_label)
@@ -582,14 +1002,19 @@ class ImageViewerContainer(QWidget):
             total_size = (self.height() if layout_type == "vertical" else self.width())
             self.splitter.setSizes([total_size // 2, total_size // 2])
 
-    def update_images(self, original_image: QImage, edited_image: QImage):
-        # Convert QImage to QPixmap for better display
-        original_pixmap = QPixmap.fromImage(original_image)
-        edited_pixmap = QPixmap.fromImage(edited_image)
+    def update_images(self, original_pyramid: ImagePyramid, edited_pyramid: ImagePyramid):
+        # Set the pyramids (scaling and tiling are handled by DraggableImageLabel)
+        self.original_label.set_pyramid(original_pyramid)
+        self.edited_label.set_pyramid(edited_pyramid)
+        
+    def set_selection_shape(self, shape):
+        """Draw this selection shape with left-drag on either image; None to reorder the views"""
+        self.original_label.selection_shape = shape
+        self.edited_label.selection_shape = shape
         
-        # Set the pixmaps (scaling will be handled by DraggableImageLabel)
-        self.original_label.setPixmap(original_pixmap)
-        self.edited_label.setPixmap(edited_pixmap)
+    def set_selection(self, selection):
+        self.original_label.set_selection(selection)
+        self.edited_label.set_selection(selection)
         
     def resizeEvent(self, event):
         super().resizeEvent(event)
@@ -598,42 +1023,165 @@ class ImageViewerContainer(QWidget):
         if self.is_dragging:
             self.update_drop_zones()
             
-    def show_processing(self, message="Processing..."):
+    def show_processing(self, message="Processing...", cancellable=False):
         self.processing_overlay.set_status(message)
+        self.processing_overlay.set_cancellable(cancellable)
         self.processing_overlay.setGeometry(self.rect())
         self.processing_overlay.show()
         QApplication.processEvents()  # Ensure UI updates
 
     def hide_processing(self):
+        self.processing_overlay.stop_run()
         self.processing_overlay.hide()
 
 
 
 class ImageViewer(QWidget):
+    history_changed = Signal()
+    selection_changed = Signal()
+    stage_started = Signal(str)  # Emitted from the worker thread, delivered queued
+    image_saved = Signal(object)  # SaveResult
+    
     def __init__(self):
         super().__init__()
         self.init_ui()
         self.processor = ImageProcessor()
+        # Huge scans live in memory-mapped scratch files instead of RAM
+        self.processor.set_backing_store(BackingStore())
+        
+        # Pyramids of the displayed arrays, reused while the arrays are unchanged
+        self.original_display = DisplayCache(self.build_pyramid)
+        self.edited_display = DisplayCache(self.build_pyramid)
+        
+        # Decodes the files around the selection into the processor's decode cache
+        self.prefetcher = Prefetcher(self.processor.decode_cache, self)
+        self.prefetcher.decoded.connect(self.on_decoded)
+        # Swap the full resolution in as soon as it is decoded
+        self.full_resolution_wanted = False
+        self.container.original_label.detail_requested.connect(self.request_full_resolution)
+        self.container.edited_label.detail_requested.connect(self.request_full_resolution)
+        
+        # Operations run off the GUI thread, one at a time
+        self.jobs = JobEngine(self)
+        self.jobs.job_started.connect(self.on_job_started)
+        self.jobs.job_finished.connect(self.on_job_finished)
+        self.jobs.job_failed.connect(self.on_job_failed)
+        self.jobs.idle.connect(self.container.hide_processing)
+        # A file picked while saves finish opens once they are done
+        self.deferred_load = None
+        self.jobs.idle.connect(self.load_deferred)
+        self.container.processing_overlay.cancel_requested.connect(self.cancel_processing)
+        
+        # Show the running stage in the overlay
+        self.processor.tracer.add_sink(CallbackSink(
+            on_start=lambda name, depth: self.stage_started.emit(name)))
+        self.stage_started.connect(self.container.processing_overlay.set_stage)
+        
+        # Operations are limited to the drawn selection; None processes the whole image
+        self.selection = None
+        self.selection_feather = 0
+        self.container.selection_drawn.connect(self.on_selection_drawn)
         
     def apply_processing(self, operation, *args, **kwargs):
-        """Generic method to apply image processing operations with overlay"""
+        """
+        Generic method to queue image processing operations with overlay.
+        The apply_* operations take selection=self.selection to stay inside it.
+        """
         if self.processor.has_image():
-            self.container.show_processing(f"Applying {operation}...")
-            try:
-                # Get the processing method from the processor
-                processing_method = getattr(self.processor, operation)
-                # Apply the processing
-                processing_method(*args, **kwargs)
-                # Update the display
-                self.update_display()
-            finally:
-                self.container.hide_processing()
-
-    def update_display(self):
+            # Get the processing method from the processor
+            processing_method = getattr(self.processor, operation)
+            # Queue the processing; the result arrives through on_job_finished
+            return self.jobs.submit(
+                processing_method, *args,
+                description=f"Applying {operation}...",
+                cancel_event=self.processor.cancel_event,
+                **kwargs)
+                
+    def build_pyramid(self, array):
+        return ImagePyramid(array, self.processor.get_qt_image)
+                
+    def cancel_processing(self):
+        """Cancel the running operation and everything queued behind it, except saves"""
+        self.jobs.cancel_all()
+        if self.jobs.pending_count():
+            self.container.processing_overlay.set_status("Finishing before the queued save...")
+        else:
+            self.container.processing_overlay.set_status("Cancelling...")
+        
+    def on_job_started(self, job):
+        message = job.description
+        if self.jobs.pending_count():
+            message += f" ({self.jobs.pending_count()} queued)"
+        self.container.show_processing(message, cancellable=True)
+        self.container.processing_overlay.start_run()
+        
+    def on_job_finished(self, job, result):
+        if isinstance(result, SaveResult):
+            self.image_saved.emit(result)
+            return
+        if isinstance(result, ColorPalette):
+            return  # Written to its file; the image is unchanged
+        if isinstance(result, np.ndarray):
+            return  # A step input fetched for editing; the image is unchanged
+        # Update the display
+        self.update_display()
+        self.history_changed.emit()
+        
+    def save_image(self, file_path, options=None):
+        """Encode and write the edited image in the background"""
         if self.processor.has_image():
-            original_qt = self.processor.get_qt_image(self.processor.current_image)
-            edited_qt = self.processor.get_qt_image(self.processor.edited_image)
-            self.container.update_images(original_qt, edited_qt)
+            return self.jobs.submit(
+                self.processor.save_image, file_path, options,
+                description=f"Saving {os.path.basename(file_path)}...",
+                cancel_event=self.processor.cancel_event, cancellable=False)
+        
+    def save_palette(self, file_path, n_colors=8):
+        """Fit (or reuse) the edited image's palette in the background and write it"""
+        if self.processor.has_image():
+            def extract_and_save():
+                palette = self.processor.extract_palette(n_colors)
+                palette.save(file_path)
+                return palette
+            return self.jobs.submit(
+                extract_and_save,
+                description=f"Saving palette {os.path.basename(file_path)}...",
+                cancel_event=self.processor.cancel_event, cancellable=False)
+        
+    def fetch_step_input(self, index, callback):
+        """Call callback with the input of step index, re-rendered in a job if evicted"""
+        job = self.jobs.submit(
+            self.processor.render_step_input, index,
+            description="Preparing the step...",
+            cancel_event=self.processor.cancel_event)
+        job.signals.finished.connect(lambda job, image: callback(image))
+        return job
+        
+    def on_job_failed(self, job, message):
+        QMessageBox.warning(self, "Error", f"{job.description}\n{message}")
+        
+    def on_selection_drawn(self, shape, points):
+        """Turn a drawn rectangle or freehand outline into the selection"""
+        try:
+            if shape == 'rectangle':
+                (left, top), (right, bottom) = points[0], points[-1]
+                if left == right or top == bottom:
+                    raise ValueError("Empty rectangle")
+                selection = Selection.rectangle(left, top, right, bottom, self.selection_feather)
+            else:
+                selection = Selection.polygon(points, self.selection_feather)
+        except ValueError:
+            selection = None  # A click or a stroke without area clears it
+        self.set_selection(selection)
+        
+    def set_selection(self, selection):
+        self.selection = selection
+        self.container.set_selection(selection)
+        self.selection_changed.emit()
+        
+    def set_selection_feather(self, feather):
+        self.selection_feather = feather
+        if self.selection is not None:
+            self.set_selection(replace(self.selection, feather=float(feather)))
 
     def init_ui(self):
         layout = QVBoxLayout(self)
@@ -641,14 +1189,63 @@ class ImageViewer(QWidget):
         layout.addWidget(self.container)
         
     def load_image(self, file_path):
-        self.processor.load_image(file_path)
+        # Never swap images under a running operation. Queued saves (and the
+        # operations whose result they write) finish before the new one loads
+        self.deferred_load = None
+        self.jobs.cancel_all()
+        if self.jobs.is_busy():
+            self.deferred_load = file_path
+            return
+        self.jobs.wait()
+        # JPEGs show a reduced decode first; operations and deep zoom need the full file
+        self.processor.load_image(file_path, preview_pixels=PREVIEW_PIXELS)
+        self.full_resolution_wanted = False
+        self.set_selection(None)
+        self.original_display.clear()
+        self.edited_display.clear()
         self.update_display()
+        self.history_changed.emit()
+        if self.processor.is_preview():
+            self.prefetcher.prefetch([file_path])
+        
+    def load_deferred(self):
+        file_path, self.deferred_load = self.deferred_load, None
+        if file_path is not None:
+            self.load_image(file_path)
+        
+    def prefetch(self, paths):
+        # The full resolution of a preview comes before the neighbours
+        if self.processor.is_preview():
+            paths = [self.processor.full_image_path] + list(paths)
+        self.prefetcher.prefetch(paths)
+        
+    def request_full_resolution(self):
+        if not self.processor.is_preview():
+            return
+        if self.processor.decode_cache.get(self.processor.full_image_path) is not None:
+            self.swap_full_resolution()
+        else:
+            self.full_resolution_wanted = True
+            
+    def on_decoded(self, path):
+        if self.full_resolution_wanted and path == self.processor.full_image_path:
+            self.swap_full_resolution()
+            
+    def swap_full_resolution(self):
+        self.full_resolution_wanted = False
+        # A running operation swaps it in itself, on its own thread
+        if not self.jobs.is_busy() and self.processor.ensure_full_resolution():
+            self.update_display()
         
     def update_display(self):
         if self.processor.has_image():
-            original_qt = self.processor.get_qt_image(self.processor.current_image)
-            edited_qt = self.processor.get_qt_image(self.processor.edited_image)
-            self.container.update_images(original_qt, edited_qt)
+            # The original pyramid is built once per load; the edited one only when it changed
+            original_pyramid = self.original_display.get(self.processor.current_image)
+            if self.processor.edited_image is self.processor.current_image:
+                edited_pyramid = original_pyramid
+            else:
+                edited_pyramid = self.edited_display.get(self.processor.edited_image)
+            self.container.update_images(original_pyramid, edited_pyramid)
 
 class ParameterSlider(QWidget):
     """Custom slider widget with label and value display"""
@@ -692,38 +1289,38 @@ class ParameterSlider(QWidget):
 # Keep only this version and remove the other two duplicate class definitions:
 class SegmentationDialog(QDialog):
     """Dialog for adjusting segmentation parameters with presets"""
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, processor=None, image=None):
         super().__init__(parent)
         self.setWindowTitle("Segmentation Parameters")
         self.setModal(True)
         
+        # Downscaled proxy of the edited image (or the given one) for the live preview
+        self.processor = processor
+        self.proxy_image = None
+        self.proxy_scale = 1.0
+        self.full_shape = None  # Shape Apply segments, which picks the 'auto' superpixel backend
+        if image is None and processor is not None:
+            image = processor.edited_image
+        if image is not None:
+            self.proxy_image, self.proxy_scale = make_proxy(image)
+            self.full_shape = image.shape[:2]
+            # Apply runs on the full resolution, not on a reduced JPEG preview
+            if (processor is not None and processor.is_preview()
+                    and image is processor.current_image):
+                self.proxy_scale *= processor.preview_scale
+                self.full_shape = tuple(round(side / processor.preview_scale)
+                                        for side in image.shape[:2])
+        self.applying_preset = False
+        
+        # Previews render off the GUI thread on their own processor
+        self.preview_processor = ImageProcessor()
+        self.preview_jobs = JobEngine(self)
+        self.preview_jobs.job_finished.connect(self.show_preview)
+        
         # Define presets
         self.presets = {
             "Custom": SegmentationParams(),  # Default parameters
-            "Cartoon": SegmentationParams(
-                n_segments=100,
-                n_colors=8,
-                compactness=20,
-                edge_weight=1.0,
-                edge_enhancement=0.8,
-                smoothing_factor=0.7
-            ),
-            "Painterly": SegmentationParams(
-                n_segments=200,
-                n_colors=12,
-                compactness=5,
-                edge_weight=0.3,
-                edge_enhancement=0.2,
-                smoothing_factor=0.6
-            ),
-            "Abstract": SegmentationParams(
-                n_segments=50,
-                n_colors=6,
-                compactness=30,
-                edge_weight=0.5,
-                edge_enhancement=0.4,
-                smoothing_factor=0.8
-            )
+            **SEGMENTATION_PRESETS
         }
         
         self.init_ui()
@@ -731,6 +1328,17 @@ class SegmentationDialog(QDialog):
     def init_ui(self):
         layout = QVBoxLayout(self)
         
+        # Live preview of the proxy image
+        self.preview_label = QLabel("No image loaded")
+        self.preview_label.setAlignment(Qt.AlignCenter)
+        self.preview_label.setMinimumSize(400, 300)
+        self.preview_label.setFrameStyle(QFrame.Panel | QFrame.Sunken)
+        layout.addWidget(self.preview_label)
+        
+        self.preview_timer = QTimer()  # Coalesce rapid slider changes
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.timeout.connect(self.update_preview)
+        
         # Preset selection
         preset_layout = QHBoxLayout()
         preset_label = QLabel("Preset:")
@@ -778,6 +1386,26 @@ class SegmentationDialog(QDialog):
         color_space_layout.addWidget(self.color_space)
         params_layout.addLayout(color_space_layout)
         
+        # Quantizer backend selection
+        quantize_layout = QHBoxLayout()
+        quantize_label = QLabel("Quantizer")
+        self.quantize_method = QComboBox()
+        self.quantize_method.addItems(['unique', 'histogram', 'exact'])
+        quantize_layout.addWidget(quantize_label)
+        quantize_layout.addWidget(self.quantize_method)
+        params_layout.addLayout(quantize_layout)
+        
+        # Superpixel backend selection; ximgproc only with opencv-contrib
+        superpixel_layout = QHBoxLayout()
+        superpixel_label = QLabel("Superpixels")
+        self.superpixel_backend = QComboBox()
+        self.superpixel_backend.addItems([
+            backend for backend in SUPERPIXEL_BACKENDS
+            if backend != 'ximgproc' or has_ximgproc()])
+        superpixel_layout.addWidget(superpixel_label)
+        superpixel_layout.addWidget(self.superpixel_backend)
+        params_layout.addLayout(superpixel_layout)
+        
         params_group.setLayout(params_layout)
         layout.addWidget(params_group)
         
@@ -806,6 +1434,8 @@ class SegmentationDialog(QDialog):
             slider.valueChanged.connect(self.on_parameter_changed)
         
         self.color_space.currentTextChanged.connect(self.on_parameter_changed)
+        self.quantize_method.currentTextChanged.connect(self.on_parameter_changed)
+        self.superpixel_backend.currentTextChanged.connect(self.on_parameter_changed)
         
         # Set initial preset
         self.apply_preset("Custom")
@@ -815,26 +1445,76 @@ class SegmentationDialog(QDialog):
         if preset_name not in self.presets:
             return
             
-        params = self.presets[preset_name]
-        
-        # Update all controls
-        self.n_segments.slider.setValue(int(params.n_segments / self.n_segments.step))
-        self.n_colors.slider.setValue(int(params.n_colors / self.n_colors.step))
-        self.compactness.slider.setValue(int(params.compactness / self.compactness.step))
-        self.sigma.slider.setValue(int(params.sigma / self.sigma.step))
-        self.edge_weight.slider.setValue(int(params.edge_weight / self.edge_weight.step))
-        self.smoothing_factor.slider.setValue(int(params.smoothing_factor / self.smoothing_factor.step))
-        self.edge_enhancement.slider.setValue(int(params.edge_enhancement / self.edge_enhancement.step))
+        self.set_parameters(self.presets[preset_name])
+        
+    def set_parameters(self, params):
+        """Load a SegmentationParams object into the controls"""
+        # Update all controls without switching back to Custom
+        self.applying_preset = True
+        self.n_segments.slider.setValue(round(params.n_segments / self.n_segments.step))
+        self.n_colors.slider.setValue(round(params.n_colors / self.n_colors.step))
+        self.compactness.slider.setValue(round(params.compactness / self.compactness.step))
+        self.sigma.slider.setValue(round(params.sigma / self.sigma.step))
+        self.edge_weight.slider.setValue(round(params.edge_weight / self.edge_weight.step))
+        self.smoothing_factor.slider.setValue(round(params.smoothing_factor / self.smoothing_factor.step))
+        self.edge_enhancement.slider.setValue(round(params.edge_enhancement / self.edge_enhancement.step))
         
         # Set color space
         index = self.color_space.findText(params.color_space)
         if index >= 0:
             self.color_space.setCurrentIndex(index)
+        
+        # Set quantizer backend
+        index = self.quantize_method.findText(params.quantize_method)
+        if index >= 0:
+            self.quantize_method.setCurrentIndex(index)
+        
+        # Set superpixel backend
+        index = self.superpixel_backend.findText(params.superpixel_backend)
+        if index >= 0:
+            self.superpixel_backend.setCurrentIndex(index)
+        self.applying_preset = False
+        
+        self.schedule_preview()
             
     def on_parameter_changed(self, *args):
         """When any parameter is changed, switch to Custom preset"""
+        if self.applying_preset:
+            return
         if self.preset_combo.currentText() != "Custom":
+            self.preset_combo.blockSignals(True)
             self.preset_combo.setCurrentText("Custom")
+            self.preset_combo.blockSignals(False)
+        self.schedule_preview()
+        
+    def schedule_preview(self):
+        """Start timer for preview delay"""
+        if self.proxy_image is not None:
+            self.preview_timer.start(150)
+            
+    def update_preview(self):
+        """Run the segmentation on the proxy with resolution-scaled parameters"""
+        params = scale_segmentation_params(self.get_parameters(), self.proxy_scale)
+        # Preview with the superpixels the full resolution will get, not the proxy's
+        params = replace(params, superpixel_backend=resolve_backend(
+            params.superpixel_backend, self.full_shape))
+        # Only the latest parameters matter, so drop any preview still running
+        self.preview_jobs.cancel_all()
+        self.preview_jobs.submit(
+            self.preview_processor.smooth_segmentation, self.proxy_image, params,
+            cancel_event=self.preview_processor.cancel_event)
+        
+    def show_preview(self, job, preview):
+        pixmap = QPixmap.fromImage(self.preview_processor.get_qt_image(preview))
+        self.preview_label.setPixmap(pixmap.scaled(
+            self.preview_label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
+    
+    def done(self, result):
+        # Don't leave a preview running after the dialog closes
+        self.preview_timer.stop()
+        self.preview_jobs.cancel_all()
+        self.preview_jobs.wait()
+        super().done(result)
     
     def get_parameters(self):
         """Return the current parameters as a SegmentationParams object"""
@@ -846,14 +1526,83 @@ class SegmentationDialog(QDialog):
             edge_weight=self.edge_weight.value(),
             color_space=self.color_space.currentText(),
             smoothing_factor=self.smoothing_factor.value(),
-            edge_enhancement=self.edge_enhancement.value()
+            edge_enhancement=self.edge_enhancement.value(),
+            quantize_method=self.quantize_method.currentText(),
+            superpixel_backend=self.superpixel_backend.currentText()
         )
 
+class SaveOptionsDialog(QDialog):
+    """Encoder settings for the chosen output format"""
+    def __init__(self, extension, options=None, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Save Options")
+        self.setModal(True)
+        self.extension = extension.lower()
+        self.options = options or EncoderOptions()
+        self.init_ui()
+        
+    def init_ui(self):
+        layout = QVBoxLayout(self)
+        options = self.options
+        
+        if self.extension == '.png':
+            self.png_compression = ParameterSlider("Compression", 0, 9, options.png_compression, 1)
+            self.png_compression.setToolTip("Higher is smaller but slower to save")
+            layout.addWidget(self.png_compression)
+        elif self.extension in ('.jpg', '.jpeg'):
+            self.jpeg_quality = ParameterSlider("Quality", 0, 100, options.jpeg_quality, 1)
+            self.jpeg_progressive = QCheckBox("Progressive")
+            self.jpeg_progressive.setChecked(options.jpeg_progressive)
+            self.jpeg_optimize = QCheckBox("Optimize (smaller, slower)")
+            self.jpeg_optimize.setChecked(options.jpeg_optimize)
+            layout.addWidget(self.jpeg_quality)
+            layout.addWidget(self.jpeg_progressive)
+            layout.addWidget(self.jpeg_optimize)
+        elif self.extension == '.webp':
+            self.webp_quality = ParameterSlider("Quality", 1, 100, options.webp_quality, 1)
+            self.webp_lossless = QCheckBox("Lossless")
+            self.webp_lossless.setChecked(options.webp_lossless)
+            self.webp_lossless.toggled.connect(lambda on: self.webp_quality.setEnabled(not on))
+            self.webp_quality.setEnabled(not options.webp_lossless)
+            layout.addWidget(self.webp_quality)
+            layout.addWidget(self.webp_lossless)
+        else:
+            layout.addWidget(QLabel("This format has no encoder options."))
+        
+        # Buttons
+        buttons = QHBoxLayout()
+        self.save_btn = QPushButton("Save")
+        self.cancel_btn = QPushButton("Cancel")
+        buttons.addWidget(self.save_btn)
+        buttons.addWidget(self.cancel_btn)
+        layout.addLayout(buttons)
+        self.save_btn.clicked.connect(self.accept)
+        self.cancel_btn.clicked.connect(self.reject)
+        
+    def get_options(self):
+        """Return the settings as EncoderOptions, keeping other formats' settings"""
+        options = replace(self.options)
+        if self.extension == '.png':
+            options.png_compression = int(self.png_compression.value())
+        elif self.extension in ('.jpg', '.jpeg'):
+            options.jpeg_quality = int(self.jpeg_quality.value())
+            options.jpeg_progressive = self.jpeg_progressive.isChecked()
+            options.jpeg_optimize = self.jpeg_optimize.isChecked()
+        elif self.extension == '.webp':
+            options.webp_quality = int(self.webp_quality.value())
+            options.webp_lossless = self.webp_lossless.isChecked()
+        return options
+
 class ToolPanel(QWidget):
     def __init__(self, image_viewer):
         super().__init__()
         self.image_viewer = image_viewer
+        # Encoder settings are remembered between saves
+        self.encoder_options = EncoderOptions()
         self.init_ui()
+        self.image_viewer.history_changed.connect(self.update_history)
+        self.image_viewer.image_saved.connect(self.on_image_saved)
+        self.image_viewer.selection_changed.connect(self.update_selection)
         
     def init_ui(self):
         layout = QVBoxLayout(self)
@@ -862,47 +1611,230 @@ class ToolPanel(QWidget):
         self.grayscale_btn = QPushButton("Grayscale")
         self.kmeans_btn = QPushButton("K-means")
         self.segment_btn = QPushButton("Smart Segmentation")
+        self.save_palette_btn = QPushButton("Save Palette")
+        self.save_palette_btn.setToolTip("Save the colours of the last K-means step for reuse")
+        self.apply_palette_btn = QPushButton("Apply Palette")
         self.save_btn = QPushButton("Save")
+        self.trace_btn = QPushButton("Save Trace")
+        self.trace_btn.setToolTip("Save a Chrome trace of the last operation")
+        
+        # Selection tool: operations only change the drawn region
+        selection_group = QGroupBox("Selection")
+        selection_layout = QVBoxLayout(selection_group)
+        self.selection_combo = QComboBox()
+        self.selection_combo.addItem("Whole Image", None)
+        for shape in SELECTION_SHAPES:
+            self.selection_combo.addItem(shape.title(), shape)
+        self.selection_combo.setToolTip("Draw the selection with the left mouse button")
+        feather_row = QHBoxLayout()
+        feather_row.addWidget(QLabel("Feather"))
+        self.feather_spin = QSpinBox()
+        self.feather_spin.setRange(0, 200)
+        self.feather_spin.setSuffix(" px")
+        feather_row.addWidget(self.feather_spin)
+        self.clear_selection_btn = QPushButton("Clear")
+        feather_row.addWidget(self.clear_selection_btn)
+        selection_layout.addWidget(self.selection_combo)
+        selection_layout.addLayout(feather_row)
+        
+        # Undo/redo buttons
+        history_buttons = QHBoxLayout()
+        self.undo_btn = QPushButton("Undo")
+        self.undo_btn.setShortcut(QKeySequence.Undo)
+        self.redo_btn = QPushButton("Redo")
+        self.redo_btn.setShortcut(QKeySequence.Redo)
+        history_buttons.addWidget(self.undo_btn)
+        history_buttons.addWidget(self.redo_btn)
+        
+        # Edit history; double-click a step to change its parameters
+        self.history_list = QListWidget()
+        self.history_list.setToolTip("Double-click a step to edit its parameters")
         
         # Add buttons to layout
         layout.addWidget(self.grayscale_btn)
         layout.addWidget(self.kmeans_btn)
         layout.addWidget(self.segment_btn)
+        layout.addWidget(self.save_palette_btn)
+        layout.addWidget(self.apply_palette_btn)
         layout.addWidget(self.save_btn)
+        layout.addWidget(self.trace_btn)
+        layout.addWidget(selection_group)
+        layout.addLayout(history_buttons)
+        layout.addWidget(QLabel("History"))
+        layout.addWidget(self.history_list)
+        
+        # Outcome of the last save
+        self.status_label = QLabel("")
+        self.status_label.setWordWrap(True)
+        layout.addWidget(self.status_label)
         
         # Connect buttons to functions
         self.grayscale_btn.clicked.connect(self.apply_grayscale)
         self.kmeans_btn.clicked.connect(self.apply_kmeans)
         self.segment_btn.clicked.connect(self.apply_segmentation)
+        self.save_palette_btn.clicked.connect(self.save_palette)
+        self.apply_palette_btn.clicked.connect(self.apply_palette)
         self.save_btn.clicked.connect(self.save_image)
-        
-        # Add stretch to push buttons to top
-        layout.addStretch()
-        
+        self.trace_btn.clicked.connect(self.save_trace)
+        self.undo_btn.clicked.connect(self.undo)
+        self.redo_btn.clicked.connect(self.redo)
+        self.history_list.itemDoubleClicked.connect(self.edit_history_step)
+        self.selection_combo.currentIndexChanged.connect(self.selection_shape_changed)
+        self.feather_spin.valueChanged.connect(self.image_viewer.set_selection_feather)
+        self.clear_selection_btn.clicked.connect(lambda: self.image_viewer.set_selection(None))
+        
+        self.update_history()
+        self.update_selection()
+        
+    def update_history(self):
+        """Refresh the history list and undo/redo buttons"""
+        history = self.image_viewer.processor.history
+        self.history_list.clear()
+        for index, step in enumerate(history.steps):
+            item = QListWidgetItem(self.describe_step(step))
+            item.setData(Qt.UserRole, index)
+            if index >= history.position:
+                item.setForeground(QColor(160, 160, 160))  # Undone, can be redone
+            self.history_list.addItem(item)
+        self.undo_btn.setEnabled(history.can_undo())
+        self.redo_btn.setEnabled(history.can_redo())
+        
+    def describe_step(self, step):
+        if step.operation == 'kmeans_clustering':
+            text = f"K-means ({step.args[0]} colors)"
+        elif step.operation == 'smooth_segmentation':
+            params = step.args[0]
+            text = f"Smart Segmentation ({params.n_colors} colors)"
+        elif step.operation == 'map_palette':
+            text = f"Palette ({len(step.args[0])} colors)"
+        else:
+            text = step.operation.replace('_', ' ').title()
+        if step.selection is not None:
+            text += " in selection"
+        return text
+        
+    def selection_shape_changed(self, index):
+        shape = self.selection_combo.itemData(index)
+        self.image_viewer.container.set_selection_shape(shape)
+        if shape is None:
+            self.image_viewer.set_selection(None)
+            
+    def update_selection(self):
+        self.clear_selection_btn.setEnabled(self.image_viewer.selection is not None)
+        
+    def save_trace(self):
+        """Write the spans of the last operation for chrome://tracing or Perfetto"""
+        file_name, _ = QFileDialog.getSaveFileName(
+            self, "Save Trace", "trace.json", "Chrome Trace (*.json)")
+        if file_name:
+            self.image_viewer.processor.save_trace(file_name)
+        
+    def undo(self):
+        self.image_viewer.apply_processing('undo')
+        
+    def redo(self):
+        self.image_viewer.apply_processing('redo')
+        
+    def edit_history_step(self, item):
+        """Re-open the parameters of a step and re-run it and everything after it"""
+        index = item.data(Qt.UserRole)
+        processor = self.image_viewer.processor
+        if index >= processor.history.position:
+            return
+        if self.image_viewer.jobs.is_busy():
+            # The running job may be changing the history cache that step_input reads
+            self.status_label.setText("Wait for the running operation to finish to edit a step")
+            return
+        step = processor.history.steps[index]
+        
+        if step.operation == 'smooth_segmentation':
+            # The preview needs the step's own input, which may have to be re-rendered
+            self.image_viewer.fetch_step_input(
+                index, lambda image: self.edit_segmentation_step(index, step, image))
+        elif step.operation == 'kmeans_clustering':
+            k, ok = QInputDialog.getInt(
+                self, "K-means Clustering", 
+                "Enter number of clusters (2-16):", step.args[0], 2, 16, 1)
+            if ok:
+                self.image_viewer.apply_processing(
+                    'edit_step', index, k, *step.args[1:])
+        
+    def edit_segmentation_step(self, index, step, image):
+        dialog = SegmentationDialog(self, self.image_viewer.processor, image)
+        dialog.set_parameters(step.args[0])
+        if dialog.exec() == QDialog.Accepted:
+            self.image_viewer.apply_processing('edit_step', index, dialog.get_parameters())
+            
     def apply_segmentation(self):
-        dialog = SegmentationDialog(self)
+        dialog = SegmentationDialog(self, self.image_viewer.processor)
         if dialog.exec() == QDialog.Accepted:
             params = dialog.get_parameters()
-            self.image_viewer.apply_processing('apply_smooth_segmentation', params)
+            self.image_viewer.apply_processing('apply_smooth_segmentation', params,
+                                               selection=self.image_viewer.selection)
         
     def apply_grayscale(self):
-        self.image_viewer.apply_processing('apply_grayscale')
+        self.image_viewer.apply_processing('apply_grayscale',
+                                           selection=self.image_viewer.selection)
         
     def apply_kmeans(self):
         k, ok = QInputDialog.getInt(
             self, "K-means Clustering", 
             "Enter number of clusters (2-16):", 8, 2, 16, 1)
         if ok:
-            self.image_viewer.apply_processing('apply_kmeans', k)
+            self.image_viewer.apply_processing('apply_kmeans', k,
+                                               selection=self.image_viewer.selection)
+            
+    def save_palette(self):
+        processor = self.image_viewer.processor
+        if not processor.has_image():
+            return
+        n_colors = 8
+        steps = processor.history.active_steps()
+        if not steps or steps[-1].operation != 'kmeans_clustering':
+            # No k-means to take the palette from: fit one on the edited image
+            n_colors, ok = QInputDialog.getInt(
+                self, "Save Palette",
+                "Enter number of colors (2-16):", 8, 2, 16, 1)
+            if not ok:
+                return
+        file_name, _ = QFileDialog.getSaveFileName(
+            self, "Save Palette", "palette.json", "Palette (*.json)")
+        if file_name:
+            self.image_viewer.save_palette(file_name, n_colors)
+            
+    def apply_palette(self):
+        if not self.image_viewer.processor.has_image():
+            return
+        file_name, _ = QFileDialog.getOpenFileName(
+            self, "Apply Palette", "", "Palette (*.json)")
+        if not file_name:
+            return
+        try:
+            palette = ColorPalette.load(file_name)
+        except (OSError, ValueError, KeyError) as e:
+            QMessageBox.warning(self, "Error", f"Could not load palette:\n{e}")
+            return
+        self.image_viewer.apply_processing('apply_palette', palette,
+                                           selection=self.image_viewer.selection)
             
     def save_image(self):
         if self.image_viewer.processor.has_image():
             file_name, _ = QFileDialog.getSaveFileName(
                 self, "Save Image", "", 
-                "Images (*.png *.jpg *.jpeg *.bmp)")
+                "Images (*.png *.jpg *.jpeg *.bmp *.webp)")
             if file_name:
-                self.image_viewer.container.show_processing("Saving image...")
-                try:
-                    self.image_viewer.processor.save_image(file_name)
-                finally:
-                    self.image_viewer.container.hide_processing()
+                dialog = SaveOptionsDialog(os.path.splitext(file_name)[1],
+                                           self.encoder_options, self)
+                if dialog.exec() == QDialog.Accepted:
+                    self.encoder_options = dialog.get_options()
+                    self.status_label.setText("")
+                    self.image_viewer.save_image(file_name, self.encoder_options)
+                    
+    def on_image_saved(self, result):
+        if result.size >= 1024 * 1024:
+            size = f"{result.size / (1024 * 1024):.1f} MB"
+        else:
+            size = f"{result.size / 1024:.0f} KB"
+        self.status_label.setText(
+            f"Saved {os.path.basename(result.path)}: {size}, "
+            f"encoded in {result.encode_seconds:.2f}s")
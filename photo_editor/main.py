@@ -1,9 +1,15 @@
 # photo_editor/main.py
+import os
 import sys
 from PySide6.QtWidgets import QApplication
 from photo_editor.gui.main_window import PhotoEditorWindow
+from photo_editor.processing.tracing import TRACE_MEMORY_ENV
 
 def main():
+    # --trace-memory adds each stage's peak allocation to saved traces
+    if '--trace-memory' in sys.argv:
+        sys.argv.remove('--trace-memory')
+        os.environ[TRACE_MEMORY_ENV] = '1'
     app = QApplication(sys.argv)
     window = PhotoEditorWindow()
     window.show()
@@ -0,0 +1,55 @@
+# photo_editor/processing/backing_store.py
+import atexit
+import os
+import shutil
+import tempfile
+import numpy as np
+
+def is_mapped(array):
+    """True for arrays whose pixels live in a memory-mapped file rather than in RAM."""
+    return isinstance(array, np.memmap) and array.filename is not None
+
+class BackingStore:
+    """
+    Scratch files that hold large working images as memory maps.
+
+    Mapped pixels are paged in as they are touched and can be dropped by
+    the OS under memory pressure without swapping, so several huge images
+    can be open at once. Arrays smaller than min_bytes stay in RAM.
+
+    Scratch files are unlinked as soon as they are mapped where the OS
+    allows it (POSIX); otherwise the whole directory is removed at exit.
+    """
+    def __init__(self, directory=None, min_bytes=256 * 1024 * 1024):
+        if directory is None:
+            directory = tempfile.mkdtemp(prefix='photo_editor-')
+            atexit.register(shutil.rmtree, directory, True)
+        else:
+            os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.min_bytes = min_bytes
+
+    def wants(self, shape, dtype):
+        return int(np.prod(shape)) * np.dtype(dtype).itemsize >= self.min_bytes
+
+    def empty(self, shape, dtype):
+        """A new writable array, memory-mapped if it is large enough."""
+        if not self.wants(shape, dtype):
+            return np.empty(shape, dtype)
+        fd, path = tempfile.mkstemp(suffix='.raw', dir=self.directory)
+        os.close(fd)
+        array = np.memmap(path, dtype=dtype, mode='w+', shape=tuple(shape))
+        try:
+            os.remove(path)  # The mapping keeps the pages alive
+        except OSError:
+            pass  # Windows keeps mapped files; removed with the directory
+        return array
+
+    def adopt(self, image):
+        """Return image moved into a read-only mapped copy, or image itself if it stays in RAM."""
+        if image is None or is_mapped(image) or not self.wants(image.shape, image.dtype):
+            return image
+        mapped = self.empty(image.shape, image.dtype)
+        mapped[...] = image
+        mapped.setflags(write=False)
+        return mapped
@@ -0,0 +1,85 @@
+# photo_editor/processing/cache.py
+import hashlib
+import weakref
+from collections import OrderedDict
+
+class ResultCache:
+    """LRU cache of image arrays bounded by the total bytes it holds"""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        image = self.entries.get(key)
+        if image is not None:
+            self.entries.move_to_end(key)
+        return image
+
+    def put(self, key, image):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return
+        if image.nbytes > self.max_bytes:
+            return
+        self.entries[key] = image
+        self.total_bytes += image.nbytes
+        # Evict least recently used results until back under budget
+        while self.total_bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.total_bytes -= evicted.nbytes
+
+    def clear(self):
+        self.entries.clear()
+        self.total_bytes = 0
+
+# Digests of read-only arrays by id(), dropped when the array is collected
+_fingerprints = {}
+
+def image_fingerprint(image):
+    """
+    Return a digest identifying an image's contents.
+
+    Read-only arrays (such as cached history results) cannot change, so
+    their digest is remembered for as long as the array is alive and
+    repeat lookups cost nothing.
+    """
+    frozen = not image.flags.writeable
+    if frozen:
+        entry = _fingerprints.get(id(image))
+        if entry is not None and entry[0]() is image:
+            return entry[1]
+
+    digest = hashlib.sha1(str((image.shape, image.dtype.str)).encode())
+    digest.update(memoryview(image if image.flags.c_contiguous else image.copy()).cast('B'))
+    fingerprint = digest.hexdigest()
+
+    if frozen:
+        key = id(image)
+        _fingerprints[key] = (weakref.ref(image, lambda _: _fingerprints.pop(key, None)),
+                              fingerprint)
+    return fingerprint
+
+class StageCache:
+    """
+    Bounded memo of pipeline stage outputs.
+
+    Keys combine the input image's fingerprint, the stage name and the
+    values of only the parameter fields that stage (and the stages before
+    it) read, so changing a late-stage parameter reuses every earlier stage.
+    """
+    def __init__(self, max_bytes=1024 * 1024 * 1024):
+        self.results = ResultCache(max_bytes)
+
+    def memoize(self, image_key, stage, params, fields, compute):
+        key = (image_key, stage) + tuple(getattr(params, field) for field in fields)
+        result = self.results.get(key)
+        if result is None:
+            result = compute()
+            # Later stages and other callers share the cached array
+            result.setflags(write=False)
+            self.results.put(key, result)
+        return result
+
+    def clear(self):
+        self.results.clear()
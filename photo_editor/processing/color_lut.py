@@ -0,0 +1,139 @@
+# photo_editor/processing/color_lut.py
+import json
+from dataclasses import dataclass
+import numpy as np
+from photo_editor.processing.quantize import assign_labels
+
+# Grid points per channel; 256 samples every 8-bit colour, so lookups are exact
+DEFAULT_LUT_SIZE = 65
+LUT_INTERPOLATIONS = ('nearest', 'trilinear')
+
+# Pixels looked up per pass, bounding the index and weight temporaries
+_APPLY_CHUNK = 1 << 20
+_TRILINEAR_CHUNK = 1 << 16
+
+@dataclass(frozen=True)
+class ColorPalette:
+    """
+    A fitted palette: k-means centers (BGR) and the 8-bit colour each maps
+    to. Tuples keep it hashable, so it can be an edit step argument.
+    """
+    centers: tuple
+    colors: tuple
+
+    @classmethod
+    def from_arrays(cls, centers, colors):
+        return cls(tuple(tuple(float(v) for v in center) for center in centers),
+                   tuple(tuple(int(v) for v in color) for color in colors))
+
+    def __len__(self):
+        return len(self.centers)
+
+    def mapping(self, pixels):
+        """Map (N, 3) colours to the colour of their nearest center."""
+        colors = np.array(self.colors, dtype=np.uint8)
+        return colors[assign_labels(pixels, np.array(self.centers))]
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({'centers': self.centers, 'colors': self.colors}, f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as f:
+            data = json.load(f)
+        centers, colors = np.array(data['centers'], float), np.array(data['colors'], int)
+        if centers.ndim != 2 or centers.shape[1] != 3 or colors.shape != centers.shape:
+            raise ValueError(f"{path} is not a palette: expected matching lists of BGR colours")
+        return cls.from_arrays(centers, np.clip(colors, 0, 255))
+
+class ColorLUT:
+    """
+    A colour-to-colour function sampled on a size**3 grid over 8-bit BGR.
+
+    Applying it is a table lookup per pixel, whatever the function cost to
+    evaluate: nearest looks up the closest grid point, trilinear blends the
+    eight around the colour (for smooth mappings; it softens palette edges).
+    """
+    def __init__(self, table):
+        self.table = np.ascontiguousarray(table, dtype=np.uint8)  # (size, size, size, 3), [b, g, r]
+        self.size = self.table.shape[0]
+        if self.size < 2:
+            raise ValueError("A colour LUT needs at least 2 grid points per channel")
+        # Per-channel offsets into the flattened table, indexed by 8-bit value:
+        # of the nearest grid point, and of the grid point below for trilinear
+        position = np.arange(256) * (self.size - 1) / 255
+        nearest = np.rint(position).astype(np.uint32)
+        below = np.minimum(position.astype(np.uint32), self.size - 2)
+        strides = (self.size * self.size, self.size, 1)
+        self._offsets = tuple(nearest * stride for stride in strides)
+        self._below_offsets = tuple(below * stride for stride in strides)
+        self._fractions = (position - below).astype(np.float32)
+        self._table_float32 = None  # Built on the first trilinear lookup
+
+    @classmethod
+    def compile(cls, mapping, size=DEFAULT_LUT_SIZE):
+        """Sample mapping, a function from (N, 3) float BGR to (N, 3) uint8, on the grid."""
+        levels = np.arange(size) * 255 / (size - 1)
+        table = np.empty((size, size, size, 3), dtype=np.uint8)
+        # A few blue planes of the grid at a time, so a 256**3 table compiles in bounded memory
+        planes = max(1, _APPLY_CHUNK // (size * size))
+        for start in range(0, size, planes):
+            grid = np.stack(np.meshgrid(levels[start:start + planes], levels, levels,
+                                        indexing='ij'), axis=-1)
+            table[start:start + planes] = mapping(grid.reshape(-1, 3)).reshape(grid.shape)
+        return cls(table)
+
+    def apply(self, image, interpolation='nearest', out=None):
+        """Map every pixel of a BGR uint8 image through the table."""
+        if interpolation not in LUT_INTERPOLATIONS:
+            raise ValueError(f"Unknown LUT interpolation: {interpolation}")
+        if out is None:
+            out = np.empty(image.shape, dtype=np.uint8)
+        elif not out.flags.c_contiguous:
+            raise ValueError("out must be C-contiguous")
+        pixels = image.reshape(-1, 3)
+        result = out.reshape(-1, 3)
+        if interpolation == 'nearest':
+            lookup, chunk = self._nearest, _APPLY_CHUNK
+        else:
+            # Eight passes over each chunk: keep it small enough to stay in cache
+            lookup, chunk = self._trilinear, _TRILINEAR_CHUNK
+        for start in range(0, len(pixels), chunk):
+            lookup(pixels[start:start + chunk], result[start:start + chunk])
+        return out
+
+    def _nearest(self, pixels, out):
+        blue, green, red = self._offsets
+        index = blue[pixels[:, 0]]
+        index += green[pixels[:, 1]]
+        index += red[pixels[:, 2]]
+        np.take(self.table.reshape(-1, 3), index, axis=0, out=out)
+
+    def _float_table(self):
+        if self._table_float32 is None:
+            self._table_float32 = self.table.reshape(-1, 3).astype(np.float32)
+        return self._table_float32
+
+    def _trilinear(self, pixels, out):
+        size = self.size
+        blue, green, red = self._below_offsets
+        index = blue[pixels[:, 0]]
+        index += green[pixels[:, 1]]
+        index += red[pixels[:, 2]]
+        fractions = [self._fractions[pixels[:, channel]] for channel in range(3)]
+        table = self._float_table()
+        accumulated = np.zeros(pixels.shape, dtype=np.float32)
+        # The eight surrounding grid points, weighted by closeness along each axis
+        for corner in range(8):
+            weight = np.ones(len(pixels), dtype=np.float32)
+            offset = 0
+            for channel, stride in enumerate((size * size, size, 1)):
+                if corner >> (2 - channel) & 1:
+                    weight *= fractions[channel]
+                    offset += stride
+                else:
+                    weight *= 1 - fractions[channel]
+            accumulated += weight[:, None] * table[index + offset]
+        np.rint(accumulated, out=accumulated)
+        out[...] = accumulated
@@ -0,0 +1,113 @@
+# photo_editor/processing/decode_cache.py
+import os
+import threading
+import cv2
+from PIL import Image
+from photo_editor.processing.cache import ResultCache
+
+REDUCED_DECODE_FLAGS = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4,
+                        8: cv2.IMREAD_REDUCED_COLOR_8}
+
+def read_reduced(path, min_pixels):
+    """
+    Decode a JPEG at 1/2, 1/4 or 1/8 scale, the smallest that still has
+    min_pixels, or return None if a reduced decode would not help.
+
+    libjpeg skips most of the DCT work at these scales, so this is several
+    times faster than a full decode. EXIF orientation is applied, as in
+    cv2.imread. The header is read with Pillow to pick the scale.
+    """
+    try:
+        with Image.open(path) as header:
+            if header.format != 'JPEG':
+                return None  # Other decoders read at full size and resize anyway
+            width, height = header.size
+    except Exception:
+        return None
+    factor = 1
+    while factor < 8 and (width // (factor * 2)) * (height // (factor * 2)) >= min_pixels:
+        factor *= 2
+    if factor == 1:
+        return None
+    return cv2.imread(path, REDUCED_DECODE_FLAGS[factor])
+
+def image_pixels(path):
+    """Pixel count of an image file from its header, or None if it cannot be read."""
+    try:
+        with Image.open(path) as header:
+            width, height = header.size
+    except Exception:
+        return None
+    return width * height
+
+class DecodeCache:
+    """
+    LRU cache of decoded image files bounded by total bytes.
+
+    Entries are keyed by path, mtime and size, so a file changed on disk is
+    decoded again. Arrays are returned read-only because they are shared.
+    Safe to call from several threads; a file being decoded by one thread
+    is waited for rather than decoded twice.
+    """
+    def __init__(self, max_bytes=1024 * 1024 * 1024):
+        self.images = ResultCache(max_bytes)
+        # Large decodes are moved here (memory-mapped) before caching, if set
+        self.backing_store = None
+        self.decoding = {}  # key -> Event set when that decode finishes
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(path):
+        stat = os.stat(path)
+        return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+    def get(self, path):
+        """Return the decoded image if it is cached, without decoding."""
+        try:
+            key = self.key(path)
+        except OSError:
+            return None
+        with self._lock:
+            return self.images.get(key)
+
+    def load(self, path):
+        """Return the decoded image, decoding and caching it on a miss (None if unreadable)."""
+        try:
+            key = self.key(path)
+        except OSError:
+            return None
+
+        while True:
+            with self._lock:
+                image = self.images.get(key)
+                if image is not None:
+                    return image
+                pending = self.decoding.get(key)
+                if pending is None:
+                    pending = self.decoding[key] = threading.Event()
+                    break
+            # Another thread is decoding this file; use its result
+            pending.wait()
+            with self._lock:
+                image = self.images.get(key)
+            if image is not None:
+                return image
+            # It failed or was evicted already; fall through and try ourselves
+
+        try:
+            image = cv2.imread(path)
+            if image is not None:
+                if self.backing_store is not None:
+                    image = self.backing_store.adopt(image)
+                image.setflags(write=False)
+                with self._lock:
+                    self.images.put(key, image)
+            return image
+        finally:
+            with self._lock:
+                del self.decoding[key]
+            pending.set()
+
+    def clear(self):
+        with self._lock:
+            self.images.clear()
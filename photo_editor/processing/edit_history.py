@@ -0,0 +1,89 @@
+# photo_editor/processing/edit_history.py
+from dataclasses import dataclass
+from photo_editor.processing.snapshot_store import SnapshotStore
+
+@dataclass(frozen=True)
+class EditStep:
+    """
+    One operation in the edit stack: an ImageProcessor method name, its
+    arguments and the Selection it is limited to (None for the whole image)
+    """
+    operation: str
+    args: tuple = ()
+    selection: object = None
+
+    def key(self):
+        # Params such as SegmentationParams are unhashable dataclasses, so
+        # key on their repr, which lists every field
+        return (self.operation, repr(self.args), repr(self.selection))
+
+class EditHistory:
+    """
+    Non-destructive edit stack with undo/redo and cached intermediate results.
+
+    Results are cached under the keys of every step up to and including
+    them, so changing step N misses the cache from N onwards while every
+    earlier prefix is still served from memory. Each result is stored as a
+    compressed delta against the one before it (see SnapshotStore).
+    """
+    def __init__(self, max_cache_bytes=1024 * 1024 * 1024):
+        self.steps = []
+        self.position = 0  # Number of active steps; steps past it can be redone
+        self.cache = SnapshotStore(max_cache_bytes)
+
+    def clear(self):
+        self.steps = []
+        self.position = 0
+        self.cache.clear()
+
+    def active_steps(self):
+        return self.steps[:self.position]
+
+    def can_undo(self):
+        return self.position > 0
+
+    def can_redo(self):
+        return self.position < len(self.steps)
+
+    def prefix_key(self, count, steps=None):
+        steps = self.steps if steps is None else steps
+        return tuple(step.key() for step in steps[:count])
+
+    def cached_result(self, count):
+        """Return the cached output of the first count steps, if still cached."""
+        return self.cache.get(self.prefix_key(count))
+
+    def store(self, count, image, steps=None):
+        # Cached results are shared, so make sure nothing edits them in place
+        image.setflags(write=False)
+        parent = self.prefix_key(count - 1, steps) if count > 1 else None
+        self.cache.put(self.prefix_key(count, steps), image, parent)
+
+    def push(self, step, result):
+        """Record a step applied on top of the current position, dropping the redo tail."""
+        del self.steps[self.position:]
+        self.steps.append(step)
+        self.position += 1
+        self.store(self.position, result)
+
+    def render(self, source, execute, count=None, steps=None):
+        """
+        Produce the image after the first count steps.
+
+        Starts from the longest cached prefix (or the source image) and runs
+        execute(step, image) for the remaining steps, caching each result.
+        """
+        steps = self.steps if steps is None else steps
+        count = self.position if count is None else count
+
+        image, start = source, 0
+        for prefix in range(count, 0, -1):
+            cached = self.cache.get(self.prefix_key(prefix, steps))
+            if cached is not None:
+                image, start = cached, prefix
+                break
+
+        for index in range(start, count):
+            image = execute(steps[index], image)
+            self.store(index + 1, image, steps)
+        return image
@@ -0,0 +1,72 @@
+# photo_editor/processing/encoding.py
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+import cv2
+
+@dataclass
+class EncoderOptions:
+    """Per-format encoder settings for saving"""
+    png_compression: int = 1         # 0 (fastest, largest) to 9 (slowest, smallest)
+    jpeg_quality: int = 95           # 0-100
+    jpeg_progressive: bool = False
+    jpeg_optimize: bool = False      # Optimized Huffman tables: smaller, slightly slower
+    webp_quality: int = 90           # 1-100
+    webp_lossless: bool = False
+
+    def imwrite_params(self, extension):
+        """cv2.imencode parameters for a file extension such as '.png'."""
+        extension = extension.lower()
+        if extension == '.png':
+            return [cv2.IMWRITE_PNG_COMPRESSION, self.png_compression]
+        if extension in ('.jpg', '.jpeg'):
+            return [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality,
+                    cv2.IMWRITE_JPEG_PROGRESSIVE, int(self.jpeg_progressive),
+                    cv2.IMWRITE_JPEG_OPTIMIZE, int(self.jpeg_optimize)]
+        if extension == '.webp':
+            # OpenCV switches WebP to lossless for qualities above 100
+            return [cv2.IMWRITE_WEBP_QUALITY, 101 if self.webp_lossless else self.webp_quality]
+        return []
+
+@dataclass
+class SaveResult:
+    path: str
+    size: int                # Bytes written
+    encode_seconds: float
+    write_seconds: float
+
+def save_atomic(image, path, options=None):
+    """
+    Encode image and write it to path through a temporary file in the same
+    directory, renamed into place only once fully written. An existing
+    file is never left half-overwritten, whatever fails.
+    """
+    options = options or EncoderOptions()
+    extension = os.path.splitext(path)[1]
+
+    start = time.perf_counter()
+    ok, encoded = cv2.imencode(extension, image, options.imwrite_params(extension))
+    if not ok:
+        raise ValueError(f"Could not encode image as {extension or 'an unknown format'}")
+    encode_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path), suffix='.tmp',
+                                     dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(encoded.data)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp files are private; give the result the usual permissions
+        os.chmod(temp_path, os.stat(path).st_mode if os.path.exists(path) else 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return SaveResult(path, encoded.nbytes, encode_seconds, time.perf_counter() - start)
@@ -1,12 +1,25 @@
 # photo_editor/processing/image_operations.py
+import math
+import threading
 import cv2
 import numpy as np
-from sklearn.cluster import KMeans
-from skimage.segmentation import slic
 from skimage.color import label2rgb
 from scipy import ndimage
-from dataclasses import dataclass
-from PySide6.QtGui import QImage
+from dataclasses import dataclass, replace
+from photo_editor.processing.region_stats import region_means, paint_regions
+from photo_editor.processing.quantize import quantize_colors, assign_labels, stretch_palette
+from photo_editor.processing.palette_cache import PaletteCache
+from photo_editor.processing.color_lut import ColorLUT, ColorPalette, DEFAULT_LUT_SIZE
+from photo_editor.processing.superpixels import resolve_backend, superpixel_labels
+from photo_editor.processing.cache import StageCache, image_fingerprint
+from photo_editor.processing.decode_cache import DecodeCache, read_reduced, image_pixels
+from photo_editor.processing.backing_store import is_mapped
+from photo_editor.processing.encoding import save_atomic
+from photo_editor.processing.edit_history import EditHistory, EditStep
+from photo_editor.processing.selection import composite
+from photo_editor.processing.tracing import Tracer, ChromeTraceSink
+from photo_editor.processing.tiling import (TilingConfig, apply_tiled, gaussian_halo,
+                                            sample_pixels)
 
 @dataclass
 class SegmentationParams:
@@ -19,159 +32,675 @@ class SegmentationParams:
     color_space: str = 'lab'      # Color space to use ('lab', 'rgb', 'hsv')
     smoothing_factor: float = 0.5  # Amount of final smoothing to apply (0-1)
     edge_enhancement: float = 0.5  # Strength of edge enhancement (0-1)
+    quantize_method: str = 'unique'  # Palette fitting backend ('exact', 'unique', 'histogram')
+    superpixel_backend: str = 'auto'  # SLIC backend ('auto', 'skimage', 'tiled', 'ximgproc')
+    spatial_scale: float = 1.0     # Scale of pixel-space radii, below 1 on preview proxies
+
+# Named parameter sets shared by the segmentation dialog and the batch CLI
+SEGMENTATION_PRESETS = {
+    "Cartoon": SegmentationParams(
+        n_segments=100,
+        n_colors=8,
+        compactness=20,
+        edge_weight=1.0,
+        edge_enhancement=0.8,
+        smoothing_factor=0.7
+    ),
+    "Painterly": SegmentationParams(
+        n_segments=200,
+        n_colors=12,
+        compactness=5,
+        edge_weight=0.3,
+        edge_enhancement=0.2,
+        smoothing_factor=0.6
+    ),
+    "Abstract": SegmentationParams(
+        n_segments=50,
+        n_colors=6,
+        compactness=30,
+        edge_weight=0.5,
+        edge_enhancement=0.4,
+        smoothing_factor=0.8
+    )
+}
+
+# SegmentationParams fields read by each memoized smooth_segmentation stage,
+# including those read by the stages it depends on
+SEGMENTATION_STAGE_FIELDS = {
+    'superpixels': ('color_space', 'sigma', 'n_segments', 'compactness',
+                    'superpixel_backend'),
+    'palette': ('color_space', 'sigma', 'n_segments', 'compactness', 'superpixel_backend',
+                'n_colors', 'quantize_method'),
+    'edges': (),
+    'edge_blend': ('color_space', 'sigma', 'n_segments', 'compactness', 'superpixel_backend',
+                   'n_colors', 'quantize_method', 'edge_weight'),
+    'smoothing': ('color_space', 'sigma', 'n_segments', 'compactness', 'superpixel_backend',
+                  'n_colors', 'quantize_method', 'edge_weight',
+                  'smoothing_factor', 'spatial_scale'),
+}
+
+class OperationCancelled(Exception):
+    """Raised inside a processing operation when its cancel_event is set"""
 
 class ImageProcessor:
     def __init__(self):
         self.current_image = None
         self.edited_image = None
+        # Set while current_image is a reduced preview of this file, with the
+        # preview's linear size relative to the full resolution
+        self.full_image_path = None
+        self.preview_scale = 1.0
+        # Set from another thread to stop the running operation between stages
+        self.cancel_event = threading.Event()
+        # Tiled execution for images above the memory budget; None disables it
+        self.tiling = TilingConfig()
+        # Applied operations with cached intermediate results
+        self.history = EditHistory()
+        # Memoized smooth_segmentation stages, so late-stage tweaks are cheap
+        self.stage_cache = StageCache()
+        # Fitted palettes per image, reused and warm-started; None fits from scratch
+        self.palette_cache = PaletteCache()
+        # Grid points per channel of compiled palette LUTs (256 is exact), and the LUTs
+        self.lut_size = DEFAULT_LUT_SIZE
+        self.lut_cache = {}
+        # Named spans around every stage; last_trace keeps the most recent run
+        self.tracer = Tracer()
+        self.last_trace = ChromeTraceSink()
+        self.tracer.add_sink(self.last_trace)
+        # Decoded files, filled ahead of time by prefetching; None decodes every load
+        self.decode_cache = DecodeCache()
+        # Memory-mapped scratch files for large working images; None keeps them in RAM
+        self.backing_store = None
+        
+    def set_backing_store(self, store):
+        """Keep large decoded images and results in a BackingStore (None for RAM only)."""
+        self.backing_store = store
+        if self.decode_cache is not None:
+            self.decode_cache.backing_store = store
+            self.decode_cache.clear()
+            
+    def _adopt(self, image):
+        """Move a large array into the backing store, if there is one."""
+        if self.backing_store is None:
+            return image
+        return self.backing_store.adopt(image)
         
-    def load_image(self, file_path):
-        self.current_image = cv2.imread(file_path)
+    def _allocate(self, shape, dtype):
+        if self.backing_store is None:
+            return np.empty(shape, dtype)
+        return self.backing_store.empty(shape, dtype)
+        
+    def _use_tiling(self, image):
+        """Tile above the memory budget, and always for mapped inputs so they stream from disk."""
+        return self.tiling is not None and (self.tiling.needs_tiling(image) or is_mapped(image))
+        
+    def load_image(self, file_path, preview_pixels=None):
+        """
+        Load a file. With preview_pixels, a JPEG that is not already decoded
+        is loaded as a reduced preview of at least that many pixels, and the
+        full resolution is only decoded by ensure_full_resolution().
+        """
+        self.full_image_path = None
+        self.preview_scale = 1.0
+        preview = None
+        if preview_pixels and (self.decode_cache is None or
+                               self.decode_cache.get(file_path) is None):
+            preview = read_reduced(file_path, preview_pixels)
+        if preview is not None:
+            self.current_image = preview
+            self.full_image_path = file_path
+            full_pixels = image_pixels(file_path)
+            if full_pixels:
+                self.preview_scale = math.sqrt(preview.shape[0] * preview.shape[1] / full_pixels)
+        else:
+            self.current_image = self._decode(file_path)
+        self.history.clear()
+        self.stage_cache.clear()
+        self._share_current_image()
+            
+    def _share_current_image(self):
+        # Operations never modify their input, so the edited image can share
+        # the original until the first operation replaces it (copy on write)
         if self.current_image is not None:
-            self.edited_image = self.current_image.copy()
+            self.current_image = self._adopt(self.current_image)
+            self.current_image.setflags(write=False)
+        self.edited_image = self.current_image
+            
+    def _decode(self, file_path):
+        if self.decode_cache is not None:
+            return self.decode_cache.load(file_path)
+        return cv2.imread(file_path)
+        
+    def is_preview(self):
+        return self.full_image_path is not None
+        
+    def ensure_full_resolution(self):
+        """Replace a reduced preview with the full-resolution image. Returns True if it did."""
+        if self.full_image_path is None:
+            return False
+        image = self._decode(self.full_image_path)
+        self.full_image_path = None
+        self.preview_scale = 1.0
+        if image is None:
+            return False
+        # Nothing can have been applied to the preview yet: operations come through here first
+        self.current_image = image
+        self.history.clear()
+        self.stage_cache.clear()
+        self._share_current_image()
+        return True
             
     def has_image(self):
         return self.current_image is not None
         
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise OperationCancelled()
+        
     def get_qt_image(self, cv_img):
-        rgb_img = cv2.cvtColor(cv_img, cv2.COLOR_BGR2RGB)
-        h, w, ch = rgb_img.shape
-        return QImage(rgb_img.data, w, h, ch * w, QImage.Format.Format_RGB888)
+        """
+        Wrap a BGR (or grayscale) array in a QImage without copying the pixels.
+
+        The QImage only points at the array's memory, so the array is kept
+        alive as an attribute of the QImage for as long as the QImage exists.
+        """
+        # Imported here so the processing package runs headless without Qt
+        from PySide6.QtGui import QImage
+        buffer = np.ascontiguousarray(cv_img, dtype=np.uint8)
+        h, w = buffer.shape[:2]
+        if buffer.ndim == 2:
+            image_format = QImage.Format.Format_Grayscale8
+        else:
+            image_format = QImage.Format.Format_BGR888
+        qt_image = QImage(buffer.data, w, h, buffer.strides[0], image_format)
+        qt_image.source_buffer = buffer
+        return qt_image
         
-    def apply_grayscale(self):
+    def _traced_run(self, name, image=None):
+        """Top-level span for one user-visible operation, starting a fresh trace."""
+        self.last_trace.clear()
+        return self.tracer.span(name, image)
+
+    def save_trace(self, file_path):
+        """Write the spans of the most recent operation as a Chrome trace file."""
+        self.last_trace.write(file_path)
+
+    def _apply_step(self, operation, *args, selection=None):
+        """
+        Run an operation on the edited image, or only inside a Selection,
+        and record it in the history.
+        """
+        self.ensure_full_resolution()
         if self.edited_image is not None:
-            self.edited_image = cv2.cvtColor(
-                self.edited_image, cv2.COLOR_BGR2GRAY)
-            self.edited_image = cv2.cvtColor(
-                self.edited_image, cv2.COLOR_GRAY2BGR)
+            step = EditStep(operation, args, selection)
+            with self._traced_run(operation, self.edited_image):
+                result = self._execute_step(step, self.edited_image)
+            self.history.push(step, result)
+            self.edited_image = result
+
+    def _execute_step(self, step, image):
+        if step.selection is not None:
+            return self._execute_in_selection(step, image)
+        return self._adopt(getattr(self, step.operation)(image, *step.args))
+
+    def _execute_in_selection(self, step, image):
+        """
+        Run a step on the selection's bounding box plus the halo the
+        operation reads around it, and blend the result back through the
+        selection mask, so the cost scales with the selection.
+        """
+        selection = step.selection
+        top, left, bottom, right = box = selection.bounds(image.shape)
+        if bottom <= top or right <= left:
+            return image  # The selection misses the image
+
+        # Process the box grown by the halo, then keep only the box
+        window_top, window_left, window_bottom, window_right = selection.bounds(
+            image.shape, self._selection_halo(step, image))
+        crop = np.ascontiguousarray(image[window_top:window_bottom, window_left:window_right])
+        with self.tracer.span('selection', crop):
+            processed = getattr(self, step.operation)(
+                crop, *self._selection_args(step, crop, image))
+        processed = processed[top - window_top:bottom - window_top,
+                              left - window_left:right - window_left]
+
+        with self.tracer.span('composite', processed):
+            out = self._allocate(image.shape, image.dtype)
+            out[...] = image
+            region = out[top:bottom, left:right]
+            composite(region, processed, selection.mask(image.shape, box), out=region)
+        return out
+
+    def _selection_halo(self, step, image):
+        """Pixels of context a step reads around a selection to match a whole-image run."""
+        if step.operation != 'smooth_segmentation':
+            return 0  # Per-pixel operations
+        params = step.args[0]
+        height, width = image.shape[:2]
+        # A superpixel, the SLIC blur, the edge dilation and the smoothing reach
+        superpixel = int(math.sqrt(height * width / max(1, params.n_segments)))
+        return (superpixel + gaussian_halo(params.sigma) + 8
+                + 3 * int(60 * params.smoothing_factor * params.spatial_scale)
+                + gaussian_halo(3 * params.spatial_scale))
+
+    def _selection_args(self, step, crop, image):
+        """Step arguments for running on a crop of image."""
+        if step.operation != 'smooth_segmentation':
+            return step.args
+        # n_segments counts superpixels over the whole frame; keep their size
+        params = step.args[0]
+        share = crop.shape[0] * crop.shape[1] / (image.shape[0] * image.shape[1])
+        return (replace(params, n_segments=max(1, round(params.n_segments * share))),
+                ) + step.args[1:]
+
+    def _render(self, count=None, steps=None):
+        return self.history.render(
+            self.current_image, self._execute_step, count, steps)
+
+    def undo(self):
+        """Step back one operation, served from the result cache when possible."""
+        if self.history.can_undo():
+            with self._traced_run('undo'):
+                self.edited_image = self._render(self.history.position - 1)
+            self.history.position -= 1
+
+    def redo(self):
+        if self.history.can_redo():
+            with self._traced_run('redo'):
+                self.edited_image = self._render(self.history.position + 1)
+            self.history.position += 1
+
+    def edit_step(self, index, *args):
+        """
+        Change the arguments of an earlier step and re-run it and the steps
+        after it; the output of the steps before it comes from the cache.
+        """
+        steps = list(self.history.steps)
+        steps[index] = EditStep(steps[index].operation, args, steps[index].selection)
+        with self._traced_run('edit_step'):
+            self.edited_image = self._render(self.history.position, steps)
+        self.history.steps = steps
+
+    def step_input(self, index):
+        """Return the cached image a step received, or None if it was evicted."""
+        if index == 0:
+            return self.current_image
+        return self.history.cached_result(index)
+
+    def render_step_input(self, index):
+        """Return the image a step received, re-rendering it if it was evicted."""
+        image = self.step_input(index)
+        if image is None:
+            with self._traced_run('render_step_input'):
+                image = self._render(index)
+        return image
+
+    def apply_grayscale(self, selection=None):
+        self._apply_step('grayscale', selection=selection)
+
+    def grayscale(self, image):
+        return self._run_local(image, self._grayscale)
+
+    def _grayscale(self, image):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+    def _run_local(self, image, func, halo=0):
+        """Run a neighbourhood operation whole, or tile by tile above the memory budget."""
+        if self._use_tiling(image):
+            return apply_tiled(image, self._cancellable(func), self.tiling.tile_size(halo),
+                               halo, allocate=self._allocate)
+        return func(image)
+
+    def _cancellable(self, func):
+        """Wrap a per-tile function so cancellation is checked before each tile."""
+        def run(*tiles):
+            self.check_cancelled()
+            return func(*tiles)
+        return run
             
-    def kmeans_clustering(self, image, n_clusters):
+    def kmeans_clustering(self, image, n_clusters, method='exact'):
         """Apply K-means clustering to the image."""
+        if self._use_tiling(image):
+            return self._kmeans_clustering_tiled(image, n_clusters, method)
+
         # Reshape the image to 2D array of pixels
         height, width, channels = image.shape
         pixels = image.reshape(-1, channels)
-        pixels = np.float32(pixels)
+        if method == 'exact':
+            pixels = np.float32(pixels)
         
-        # Apply k-means clustering
-        kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-        labels = kmeans.fit_predict(pixels)
+        # Apply k-means clustering with the selected quantizer backend
+        with self.tracer.span('kmeans_fit', pixels, method=method):
+            centers, labels = self._fit_palette(
+                pixels, n_clusters, method, 'bgr', image_fingerprint(image))
+        self.check_cancelled()
         
-        # Get the quantized colors
-        centers = kmeans.cluster_centers_
-        
-        # Map each pixel to its closest center
-        quantized = centers[labels]
-        
-        # Normalize to 0-255 range
-        quantized = ((quantized - quantized.min()) / 
-                    (quantized.max() - quantized.min()) * 255).astype(np.uint8)
+        with self.tracer.span('palette_mapping'):
+            # Normalize the centers to 0-255, then map each pixel to its center
+            quantized = stretch_palette(centers)[labels]
         
         # Reshape back to original image dimensions
         return quantized.reshape(height, width, channels)
+
+    def _kmeans_clustering_tiled(self, image, n_clusters, method='exact'):
+        """K-means fitted on a pixel sample and applied tile by tile."""
+        palette = self.palette_from_image(image, n_clusters, method)
+
+        # Find the nearest center once per 8-bit colour rather than once per pixel
+        with self.tracer.span('lut_compile'):
+            lut = ColorLUT.compile(palette.mapping, size=256)
+
+        def quantize_tile(tile):
+            self.check_cancelled()
+            return lut.apply(tile)
+
+        with self.tracer.span('palette_mapping (tiled)', image):
+            return apply_tiled(image, quantize_tile, self.tiling.tile_size(),
+                               allocate=self._allocate)
+
+    def palette_from_image(self, image, n_colors, method='exact'):
+        """
+        Fit the ColorPalette kmeans_clustering would use on image: its
+        centers and the colours they map to, stretched to fill 0-255.
+        """
+        if self._use_tiling(image):
+            # The sample stands in for the image, which may be too large to fingerprint
+            pixels = sample_pixels(image, self.tiling.sample_pixels)
+            image_key = image_fingerprint(pixels)
+        else:
+            pixels = image.reshape(-1, image.shape[2])
+            image_key = image_fingerprint(image)
+        if method == 'exact':
+            pixels = np.float32(pixels)
+        with self.tracer.span('kmeans_fit', pixels, method=method):
+            centers, _ = self._fit_palette(pixels, n_colors, method, 'bgr', image_key)
+        # Every center owns some pixels, so its range is the output range
+        return ColorPalette.from_arrays(centers, stretch_palette(centers))
+
+    def extract_palette(self, n_colors=8, method='exact'):
+        """
+        Palette of the edited image. When the last step is k-means, it is
+        that step's palette, refitted on its input (a palette cache hit),
+        so applying it elsewhere reproduces the same look.
+        """
+        self.ensure_full_resolution()
+        image = self.edited_image
+        steps = self.history.active_steps()
+        if steps and steps[-1].operation == 'kmeans_clustering':
+            n_colors, method = steps[-1].args[0], steps[-1].args[1]
+            image = self.step_input(len(steps) - 1)
+            if image is None:
+                image = self._render(len(steps) - 1)
+        return self.palette_from_image(image, n_colors, method)
+
+    def apply_palette(self, palette, interpolation='nearest', selection=None):
+        """Map the edited image to a saved ColorPalette without refitting."""
+        self._apply_step('map_palette', palette, interpolation, selection=selection)
+
+    def map_palette(self, image, palette, interpolation='nearest'):
+        """Map every pixel to the colour of its nearest palette center through a 3D LUT."""
+        lut = self._palette_lut(palette)
+        return self._run_local(image, lambda tile: lut.apply(tile, interpolation))
+
+    def _palette_lut(self, palette):
+        """Compiled LUT of a palette, kept for reuse across images."""
+        lut = self.lut_cache.get(palette)
+        if lut is None:
+            with self.tracer.span('lut_compile', size=self.lut_size):
+                lut = ColorLUT.compile(palette.mapping, self.lut_size)
+            self.lut_cache[palette] = lut
+            while len(self.lut_cache) > 4:
+                self.lut_cache.pop(next(iter(self.lut_cache)))
+        return lut
             
-    def apply_kmeans(self, k):
-        """Apply k-means clustering to the image with progress updates."""
-        if self.edited_image is not None:
-            # Apply kmeans clustering
-            self.edited_image = self.kmeans_clustering(self.edited_image, k)
+    def _fit_palette(self, pixels, n_colors, method, space, image_key, data_key=None):
+        """
+        Fit a palette through the palette cache. image_key identifies the
+        source image and data_key the pixels fitted, if they differ from it.
+        """
+        if self.palette_cache is None:
+            return quantize_colors(pixels, n_colors, method=method)
+        return self.palette_cache.quantize(
+            image_key, space, data_key or image_key, pixels, n_colors, method)
             
-# photo_editor/processing/image_operations.py
-def smooth_segmentation(self, image, params: SegmentationParams):
-    """
-    Enhanced segmentation with controllable parameters.
-    """
-    # Convert to specified color space
-    if params.color_space == 'lab':
-        working_image = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
-    elif params.color_space == 'hsv':
-        working_image = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-    else:
-        working_image = image.copy()
-
-    # Apply initial Gaussian smoothing
-    if params.sigma > 0:
-        working_image = cv2.GaussianBlur(
-            working_image, 
-            (0, 0), 
-            params.sigma
-        )
-
-    # Generate superpixels
-    segments = slic(
-        working_image,
-        n_segments=params.n_segments,
-        compactness=params.compactness,
-        sigma=params.sigma,
-        start_label=0
-    )
+    def apply_kmeans(self, k, method='exact', selection=None):
+        """Apply k-means clustering to the image with progress updates."""
+        self._apply_step('kmeans_clustering', k, method, selection=selection)
 
-    # Calculate mean color for each superpixel
-    result = np.zeros_like(image)
-    for segment_id in range(segments.max() + 1):
-        mask = segments == segment_id
-        mean_color = image[mask].mean(axis=0)
-        result[mask] = mean_color
-
-    # Convert pixels to a list of tuples for k-means
-    pixels = result.reshape(-1, 3)
-    
-    # Apply K-means to the unique colors
-    kmeans = KMeans(
-        n_clusters=params.n_colors,
-        random_state=42,
-        n_init=10
-    )
-    kmeans.fit(pixels)
-    
-    # Create the quantized image directly
-    quantized = kmeans.cluster_centers_[kmeans.labels_]
-    final_result = quantized.reshape(image.shape)
-
-    # Edge preservation and enhancement
-    if params.edge_weight > 0:
-        edges = cv2.Canny(
-            cv2.cvtColor(image, cv2.COLOR_BGR2GRAY),
-            100,
-            200
-        )
-        edges = cv2.dilate(edges, None)
-        edge_mask = edges > 0
-        
-        # Preserve original edges
-        final_result[edge_mask] = image[edge_mask] * params.edge_weight + \
-                                final_result[edge_mask] * (1 - params.edge_weight)
-
-    # Final smoothing with edge preservation
-    if params.smoothing_factor > 0:
-        final_result = cv2.edgePreservingFilter(
-            final_result.astype(np.uint8),
-            flags=cv2.RECURS_FILTER,
-            sigma_s=int(60 * params.smoothing_factor),
-            sigma_r=0.4
-        )
-
-    # Edge enhancement
-    if params.edge_enhancement > 0:
-        sharpened = cv2.addWeighted(
-            final_result, 1 + params.edge_enhancement,
-            cv2.GaussianBlur(final_result, (0, 0), 3),
-            -params.edge_enhancement, 0
-        )
-        final_result = np.clip(sharpened, 0, 255).astype(np.uint8)
-
-    return final_result
-
-def apply_smooth_segmentation(self, params: SegmentationParams = None):
-    """Apply smooth segmentation with given parameters."""
-    if params is None:
-        params = SegmentationParams()
-        
-    if self.edited_image is not None:
-        self.edited_image = self.smooth_segmentation(
-            self.edited_image, 
-            params
-        )
-
-def save_image(self, file_path):
-    if self.edited_image is not None:
-        cv2.imwrite(file_path, self.edited_image)
\ No newline at end of file
+    def smooth_segmentation(self, image, params: SegmentationParams, segments=None,
+                            palette_key=None):
+        """
+        Enhanced segmentation with controllable parameters.
+
+        For video frames, segments reuses a superpixel label map from a
+        similar earlier frame instead of running SLIC, and palette_key
+        groups palettes under the stream rather than the frame, so each
+        frame warm-starts from the last one's palette. Frames are not
+        memoized. The tiled path ignores both.
+        """
+        if self._use_tiling(image):
+            return self._smooth_segmentation_tiled(image, params)
+
+        # Each stage is memoized on the image and the fields it depends on
+        image_key = image_fingerprint(image)
+        streaming = segments is not None or palette_key is not None
+
+        def stage(name, compute):
+            self.check_cancelled()
+            with self.tracer.span(name):
+                if streaming:
+                    return compute()
+                return self.stage_cache.memoize(
+                    image_key, name, params, SEGMENTATION_STAGE_FIELDS[name], compute)
+
+        # Superpixels coloured with their mean color
+        result = stage('superpixels', lambda: self._superpixel_means(image, params, segments))
+
+        def fit_palette():
+            # Convert pixels to a list of tuples for k-means
+            pixels = result.reshape(-1, 3)
+
+            # Apply K-means to the unique colors, warm-started from earlier palettes
+            centers, labels = self._fit_palette(
+                pixels,
+                params.n_colors,
+                params.quantize_method,
+                params.color_space,
+                palette_key or image_key,
+                image_fingerprint(result)
+            )
+
+            # Gather from the palette rounded to 8 bits, so the cached copy stays uint8
+            return paint_regions(labels, centers, np.uint8).reshape(image.shape)
+
+        quantized = stage('palette', fit_palette)
+
+        # Edge preservation and enhancement
+        def blend_edges():
+            if params.edge_weight <= 0:
+                return quantized
+            edge_mask = stage('edges', lambda: self._edge_mask(image))
+            return self._preserve_edges(image, quantized.copy(), params, edge_mask)
+
+        final_result = stage('edge_blend', blend_edges)
+
+        # Final smoothing with edge preservation
+        final_result = stage('smoothing', lambda: self._smooth(final_result, params))
+
+        # Edge enhancement is cheap enough to always recompute
+        self.check_cancelled()
+        with self.tracer.span('sharpen'):
+            return self._sharpen(final_result, params)
+
+    def _superpixel_means(self, image, params: SegmentationParams, segments=None):
+        """Generate superpixels (unless given) and paint each one with its mean color."""
+        if segments is None:
+            segments = self.superpixel_segments(image, params)
+
+        # Calculate mean color for each superpixel in one pass
+        with self.tracer.span('region_means', segments):
+            mean_colors, _ = region_means(segments, image)
+            return paint_regions(segments, mean_colors, image.dtype)
+
+    def superpixel_segments(self, image, params: SegmentationParams):
+        """The SLIC label map smooth_segmentation builds on."""
+        # Convert to specified color space
+        with self.tracer.span('color_conversion', image):
+            if params.color_space == 'lab':
+                working_image = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
+            elif params.color_space == 'hsv':
+                working_image = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+            else:
+                working_image = image  # Only read from, so no copy
+
+        # Apply initial Gaussian smoothing, in place on a converted copy
+        if params.sigma > 0:
+            with self.tracer.span('gaussian_blur', working_image):
+                working_image = cv2.GaussianBlur(
+                    working_image, 
+                    (0, 0), 
+                    params.sigma,
+                    dst=None if working_image is image else working_image
+                )
+
+        # Generate superpixels
+        self.check_cancelled()
+        backend = resolve_backend(params.superpixel_backend, working_image.shape)
+        with self.tracer.span('slic', working_image, n_segments=params.n_segments,
+                              backend=backend):
+            return superpixel_labels(
+                working_image,
+                n_segments=params.n_segments,
+                compactness=params.compactness,
+                sigma=params.sigma,
+                backend=backend
+            )
+
+    def _edge_mask(self, image):
+        """Dilated Canny edges of the image as a boolean mask."""
+        with self.tracer.span('canny', image):
+            edges = cv2.Canny(
+                cv2.cvtColor(image, cv2.COLOR_BGR2GRAY),
+                100,
+                200
+            )
+            edges = cv2.dilate(edges, None)
+            return edges > 0
+
+    def _preserve_edges(self, image, final_result, params: SegmentationParams,
+                        edge_mask=None):
+        """Blend the original pixels back in along detected edges, in place."""
+        if params.edge_weight > 0:
+            if edge_mask is None:
+                edge_mask = self._edge_mask(image)
+
+            # Preserve original edges: blend in 8 bits, keep the blend only on edges
+            blended = cv2.addWeighted(image, params.edge_weight,
+                                      final_result, 1 - params.edge_weight, 0)
+            np.copyto(final_result, blended, where=edge_mask[..., None])
+        return final_result
+
+    def _smooth_and_sharpen(self, final_result, params: SegmentationParams):
+        """Apply the edge-preserving smoothing and the final sharpening."""
+        return self._sharpen(self._smooth(final_result, params), params)
+
+    def _smooth(self, final_result, params: SegmentationParams):
+        """Final smoothing with edge preservation."""
+        if params.smoothing_factor > 0:
+            with self.tracer.span('edge_preserving_filter', final_result):
+                final_result = cv2.edgePreservingFilter(
+                    final_result.astype(np.uint8, copy=False),
+                    flags=cv2.RECURS_FILTER,
+                    sigma_s=max(1, int(60 * params.smoothing_factor * params.spatial_scale)),
+                    sigma_r=0.4
+                )
+        return final_result
+
+    def _sharpen(self, final_result, params: SegmentationParams):
+        """Edge enhancement, always returning an 8-bit image."""
+        final_result = final_result.astype(np.uint8, copy=False)
+        if params.edge_enhancement > 0:
+            # 8-bit in and out: addWeighted rounds and saturates, and the
+            # blurred copy is reused as the output buffer
+            blurred = cv2.GaussianBlur(final_result, (0, 0), 3 * params.spatial_scale)
+            final_result = cv2.addWeighted(
+                final_result, 1 + params.edge_enhancement,
+                blurred, -params.edge_enhancement, 0, dst=blurred
+            )
+
+        return final_result
+
+    def _smooth_segmentation_tiled(self, image, params: SegmentationParams):
+        """
+        Memory-bounded smooth_segmentation for images above the tiling budget.
+
+        Superpixels are generated per tile and merged (labels never cross a
+        tile border), the palette is fitted on a strided sample, and the
+        neighbourhood filters run tile by tile with enough halo that the
+        stitched output has no seams.
+        """
+        tiling = self.tiling
+        total_area = image.shape[0] * image.shape[1]
+
+        # Superpixels per tile, keeping the requested density for the whole image
+        def superpixel_tile(tile):
+            self.check_cancelled()
+            share = tile.shape[0] * tile.shape[1] / total_area
+            tile_params = replace(
+                params, n_segments=max(1, round(params.n_segments * share)))
+            return self._superpixel_means(tile, tile_params)
+
+        with self.tracer.span('superpixels (tiled)', image):
+            result = apply_tiled(image, superpixel_tile, tiling.tile_size(),
+                                 allocate=self._allocate)
+
+        # Fit the palette on a sample of the superpixel image
+        with self.tracer.span('palette'):
+            sample = sample_pixels(result, tiling.sample_pixels)
+            centers, _ = self._fit_palette(
+                sample,
+                params.n_colors,
+                params.quantize_method,
+                params.color_space,
+                image_fingerprint(sample_pixels(image, tiling.sample_pixels)),
+                image_fingerprint(sample)
+            )
+
+        # Map to the palette and blend edges; Canny and dilate read a few pixels around
+        palette = np.clip(np.rint(centers), 0, 255).astype(np.uint8)
+        def quantize_tile(tile, source):
+            self.check_cancelled()
+            labels = assign_labels(tile.reshape(-1, 3), centers)
+            quantized = palette[labels].reshape(tile.shape)
+            return self._preserve_edges(source, quantized, params)
+
+        edge_halo = 8
+        with self.tracer.span('edge_blend (tiled)', result):
+            final_result = apply_tiled(
+                result, quantize_tile, tiling.tile_size(edge_halo), edge_halo,
+                extra=(image,), allocate=self._allocate)
+        del result
+
+        # The recursive filter's reach is bounded by a few sigma_s
+        halo = (3 * int(60 * params.smoothing_factor * params.spatial_scale)
+                + gaussian_halo(3 * params.spatial_scale))
+        with self.tracer.span('smoothing (tiled)', final_result):
+            return apply_tiled(
+                final_result,
+                self._cancellable(lambda tile: self._smooth_and_sharpen(tile, params)),
+                tiling.tile_size(halo), halo, allocate=self._allocate)
+
+    def apply_smooth_segmentation(self, params: SegmentationParams = None, selection=None):
+        """Apply smooth segmentation with given parameters."""
+        if params is None:
+            params = SegmentationParams()
+
+        self._apply_step('smooth_segmentation', params, selection=selection)
+
+    def save_image(self, file_path, options=None):
+        """Write the edited image atomically with EncoderOptions; returns a SaveResult."""
+        self.ensure_full_resolution()
+        if self.edited_image is not None:
+            with self.tracer.span('save', self.edited_image):
+                return save_atomic(self.edited_image, file_path, options)
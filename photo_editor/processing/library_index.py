@@ -0,0 +1,217 @@
+# photo_editor/processing/library_index.py
+import os
+import sqlite3
+import threading
+from PIL import Image
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'photo_editor', 'library.sqlite3')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tif', '.tiff', '.webp')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    directory TEXT NOT NULL,
+    name TEXT NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    format TEXT,
+    mtime REAL,
+    size INTEGER,
+    camera TEXT,
+    taken TEXT
+);
+CREATE INDEX IF NOT EXISTS files_directory ON files(directory);
+CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(
+    name, directory, camera, content='files', content_rowid='id', tokenize='trigram');
+CREATE TRIGGER IF NOT EXISTS files_insert AFTER INSERT ON files BEGIN
+    INSERT INTO files_fts(rowid, name, directory, camera)
+    VALUES (new.id, new.name, new.directory, new.camera);
+END;
+CREATE TRIGGER IF NOT EXISTS files_delete AFTER DELETE ON files BEGIN
+    INSERT INTO files_fts(files_fts, rowid, name, directory, camera)
+    VALUES ('delete', old.id, old.name, old.directory, old.camera);
+END;
+CREATE TRIGGER IF NOT EXISTS files_update AFTER UPDATE ON files BEGIN
+    INSERT INTO files_fts(files_fts, rowid, name, directory, camera)
+    VALUES ('delete', old.id, old.name, old.directory, old.camera);
+    INSERT INTO files_fts(rowid, name, directory, camera)
+    VALUES (new.id, new.name, new.directory, new.camera);
+END;
+"""
+
+def read_metadata(path):
+    """Dimensions, format and basic EXIF from the file header, without decoding pixels."""
+    width = height = None
+    format = camera = taken = None
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+            format = image.format
+            exif = image.getexif()
+            camera = ' '.join(str(exif[tag]).strip() for tag in (0x010F, 0x0110)  # Make, Model
+                              if exif.get(tag)) or None
+            taken = exif.get_ifd(0x8769).get(0x9003) or exif.get(0x0132)  # DateTimeOriginal, DateTime
+    except Exception:
+        pass  # Still index the file by name
+    return width, height, format, camera, taken
+
+class LibraryIndex:
+    """
+    Persistent SQLite index of the images under a set of library roots.
+
+    Names, folders and camera models are searchable by substring through an
+    FTS5 trigram index, so a query answers without touching the file
+    system. Each thread gets its own connection; the database runs in WAL
+    mode so searches are not blocked by a rescan in progress.
+    """
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self.connection().executescript(SCHEMA)
+
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def scan(self, root, recursive=True, cancel_event=None, batch_size=500):
+        """
+        Bring the index up to date with a directory.
+
+        Files whose mtime and size are unchanged are skipped, so rescans
+        only read the headers of new or modified files. Returns the number
+        of files added or updated and the number removed.
+        """
+        root = os.path.abspath(root)
+        connection = self.connection()
+        if recursive:
+            rows = connection.execute(
+                "SELECT path, mtime, size FROM files WHERE directory = ? OR directory LIKE ? ESCAPE '\\'",
+                (root, _like_prefix(root)))
+        else:
+            rows = connection.execute("SELECT path, mtime, size FROM files WHERE directory = ?",
+                                      (root,))
+        known = {path: (mtime, size) for path, mtime, size in rows}
+
+        seen = set()
+        pending = []
+        updated = 0
+        for path, stat in _walk_images(root, recursive):
+            if cancel_event is not None and cancel_event.is_set():
+                return updated, 0
+            seen.add(path)
+            if known.get(path) == (stat.st_mtime, stat.st_size):
+                continue
+            pending.append((path, os.path.dirname(path), os.path.basename(path),
+                            *read_metadata(path), stat.st_mtime, stat.st_size))
+            if len(pending) >= batch_size:
+                updated += self._upsert(pending)
+                pending = []
+        updated += self._upsert(pending)
+
+        removed = [path for path in known if path not in seen]
+        with self._write_lock, connection:
+            connection.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in removed])
+        return updated, len(removed)
+
+    def _upsert(self, rows):
+        if not rows:
+            return 0
+        connection = self.connection()
+        with self._write_lock, connection:
+            connection.executemany("""
+                INSERT INTO files (path, directory, name, width, height, format, camera, taken,
+                                   mtime, size)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(path) DO UPDATE SET
+                    width = excluded.width, height = excluded.height, format = excluded.format,
+                    camera = excluded.camera, taken = excluded.taken,
+                    mtime = excluded.mtime, size = excluded.size""", rows)
+        return len(rows)
+
+    def remove_root(self, root):
+        """Drop every file under a directory that is no longer part of the library."""
+        root = os.path.abspath(root)
+        connection = self.connection()
+        with self._write_lock, connection:
+            connection.execute("DELETE FROM files WHERE directory = ? OR directory LIKE ? ESCAPE '\\'",
+                               (root, _like_prefix(root)))
+
+    def search(self, text, limit=500):
+        """
+        Paths of indexed images whose name, folder or camera contain every
+        word of text (case-insensitive), sorted by name.
+
+        At most limit matches are returned. They are sorted after the query
+        rather than in it, so a broad query can stop early instead of
+        ordering every match in the library.
+        """
+        words = text.split()
+        if not words:
+            return []
+        # Trigrams need three characters; shorter words fall back to LIKE
+        # on the rows the longer words already narrowed down
+        long_words = [word for word in words if len(word) >= 3]
+        short_words = [word for word in words if len(word) < 3]
+
+        clauses, args = [], []
+        if long_words:
+            # Drive the query from the full-text index so it streams matches
+            sql = "SELECT files.path FROM files_fts JOIN files ON files.id = files_fts.rowid"
+            clauses.append("files_fts MATCH ?")
+            args.append(' AND '.join('"%s"' % word.replace('"', '""') for word in long_words))
+        else:
+            sql = "SELECT path FROM files"
+        for word in short_words:
+            clauses.append("(files.name LIKE ? ESCAPE '\\' OR files.directory LIKE ? ESCAPE '\\')")
+            pattern = '%' + _escape_like(word) + '%'
+            args += [pattern, pattern]
+        sql += " WHERE " + " AND ".join(clauses) + " LIMIT ?"
+        args.append(limit)
+        matches = self.connection().execute(sql, args).fetchall()
+        return [path for path, in sorted(matches, key=lambda row: os.path.basename(row[0]).lower())]
+
+    def file_info(self, path):
+        row = self.connection().execute(
+            "SELECT width, height, format, mtime, size, camera, taken FROM files WHERE path = ?",
+            (path,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('width', 'height', 'format', 'mtime', 'size', 'camera', 'taken'), row))
+
+    def count(self):
+        return self.connection().execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+def _escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def _like_prefix(directory):
+    return _escape_like(os.path.join(directory, '')) + '%'
+
+def _walk_images(root, recursive):
+    """Yield (path, stat) for the image files under root."""
+    directories = [root]
+    while directories:
+        directory = directories.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    # Hidden directories hold caches (including our thumbnails), not photos
+                    if recursive and not entry.name.startswith('.'):
+                        directories.append(entry.path)
+                elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield entry.path, entry.stat()
+            except OSError:
+                continue
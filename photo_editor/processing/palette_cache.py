@@ -0,0 +1,100 @@
+# photo_editor/processing/palette_cache.py
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+import numpy as np
+from photo_editor.processing.quantize import quantize_colors, assign_palette
+
+# Pixels considered when choosing the centers added to a warm start
+_SEED_CANDIDATES = 20000
+
+@dataclass
+class Palette:
+    """Fitted k-means centers and the share of pixels each one labels"""
+    centers: np.ndarray
+    weights: np.ndarray
+
+def warm_start_centers(palette, samples, n_clusters):
+    """
+    Starting centers for n_clusters from a palette fitted with a different k.
+
+    With fewer clusters the most used centers are kept. With more, the
+    samples farthest from every center so far are added one by one, as in
+    the farthest-point step of k-means++.
+    """
+    centers = palette.centers
+    if len(centers) >= n_clusters:
+        keep = np.argsort(-palette.weights, kind='stable')[:n_clusters]
+        return centers[keep].astype(np.float64)
+
+    candidates = np.asarray(samples[::max(1, len(samples) // _SEED_CANDIDATES)], np.float64)
+    distances = ((candidates[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2).min(axis=1)
+    seeds = [center for center in centers]
+    while len(seeds) < n_clusters:
+        index = int(distances.argmax())
+        seeds.append(candidates[index])
+        distances = np.minimum(distances, ((candidates - candidates[index]) ** 2).sum(axis=1))
+    return np.array(seeds, dtype=np.float64)
+
+class PaletteCache:
+    """
+    Fitted palettes per image, for fast repeated k-means runs.
+
+    Palettes are grouped by source image (image_key) and colour space, and
+    stored under the fingerprint of the pixels they were fitted on
+    (data_key), the quantizer method and k. An exact repeat reuses the
+    stored centers without fitting. Any other k, or the same image seen
+    through different superpixels, starts from the nearest stored palette
+    of the group and runs k-means once instead of ten times.
+    """
+    def __init__(self, max_images=16, max_palettes=64):
+        self.max_images = max_images
+        self.max_palettes = max_palettes
+        self.groups = OrderedDict()  # (image_key, space) -> OrderedDict of (data_key, method, k) -> Palette
+        self._lock = threading.Lock()
+
+    def quantize(self, image_key, space, data_key, pixels, n_colors, method='exact'):
+        """quantize_colors through the cache. Returns (centers, labels)."""
+        key = (data_key, method, n_colors)
+        with self._lock:
+            palettes = self.groups.get((image_key, space))
+            if palettes is not None:
+                self.groups.move_to_end((image_key, space))
+            palette = palettes.get(key) if palettes else None
+            nearest = self._nearest(palettes, key) if palettes and palette is None else None
+
+        if palette is not None:
+            return palette.centers, assign_palette(pixels, palette.centers, method)
+
+        init = None
+        if nearest is not None:
+            init = lambda samples, n_clusters: warm_start_centers(nearest, samples, n_clusters)
+        centers, labels = quantize_colors(pixels, n_colors, method=method, init=init)
+
+        weights = np.bincount(labels, minlength=len(centers)) / max(1, len(labels))
+        self._store((image_key, space), key, Palette(centers, weights))
+        return centers, labels
+
+    def _nearest(self, palettes, key):
+        """Stored palette with the closest k, preferring the same pixels and method."""
+        data_key, method, n_colors = key
+        def distance(entry):
+            other_data, other_method, other_colors = entry
+            return (abs(other_colors - n_colors), other_data != data_key, other_method != method)
+        # Newest first, so ties go to the latest fit (the previous frame of a video)
+        return palettes[min(reversed(palettes), key=distance)]
+
+    def _store(self, group_key, key, palette):
+        with self._lock:
+            palettes = self.groups.setdefault(group_key, OrderedDict())
+            self.groups.move_to_end(group_key)
+            palettes[key] = palette
+            palettes.move_to_end(key)
+            while len(palettes) > self.max_palettes:
+                palettes.popitem(last=False)
+            while len(self.groups) > self.max_images:
+                self.groups.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self.groups.clear()
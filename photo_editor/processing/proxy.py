@@ -0,0 +1,39 @@
+# photo_editor/processing/proxy.py
+import math
+import cv2
+from dataclasses import replace
+
+# Default size of the preview proxy, in pixels
+PREVIEW_PIXELS = 1_000_000
+
+def make_proxy(image, max_pixels=PREVIEW_PIXELS):
+    """
+    Downscale an image to at most max_pixels for previews.
+
+    Returns (proxy, scale) where scale is the proxy/original linear factor;
+    images already within the limit are returned as-is with scale 1.0.
+    """
+    height, width = image.shape[:2]
+    if height * width <= max_pixels:
+        return image, 1.0
+
+    scale = math.sqrt(max_pixels / (height * width))
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA), scale
+
+def scale_segmentation_params(params, scale):
+    """
+    Adapt SegmentationParams so a run on a proxy matches the full-size result.
+
+    n_segments and n_colors are counts over the whole frame, and SLIC
+    compactness is relative to the superpixel size, so they carry over
+    unchanged. Everything measured in pixels (the blur sigma and the
+    smoothing/sharpening radii via spatial_scale) shrinks with the image.
+    """
+    if scale == 1.0:
+        return params
+    return replace(
+        params,
+        sigma=params.sigma * scale,
+        spatial_scale=params.spatial_scale * scale
+    )
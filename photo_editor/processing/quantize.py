@@ -0,0 +1,146 @@
+# photo_editor/processing/quantize.py
+import numpy as np
+from sklearn.cluster import KMeans
+
+# Quantizer backends selectable through the method= option
+QUANTIZE_METHODS = ('exact', 'unique', 'histogram')
+
+# From this many pixels 'unique' counts colours in dense 2**24 tables instead of sorting
+_DENSE_UNIQUE_PIXELS = 8_000_000
+
+def _pack_colors(pixels, shift=0):
+    """Pack 8-bit colour rows into single integer keys (one byte per channel)."""
+    bits = 8 - shift
+    keys = np.zeros(len(pixels), dtype=np.uint32)
+    # One channel at a time, in place, so no widened copy of all pixels is made
+    for c in range(pixels.shape[1]):
+        keys <<= bits
+        keys |= pixels[:, c] >> shift
+    return keys
+
+def _group_pixels(pixels, method, bins):
+    """
+    Collapse pixels into a compact weighted set.
+
+    Returns (samples, weights, inverse) where samples[inverse] approximates
+    the original pixels and weights holds how many pixels share each sample.
+    """
+    if method == 'unique':
+        if pixels.dtype == np.uint8 and pixels.shape[1] == 3 and len(pixels) >= _DENSE_UNIQUE_PIXELS:
+            # Count every possible colour instead of sorting: fixed-size tables
+            # that cost less than np.unique's per-pixel index arrays on large images
+            keys = _pack_colors(pixels)
+            key_counts = np.bincount(keys, minlength=1 << 24)
+            occupied = np.flatnonzero(key_counts)
+            key_to_sample = np.zeros(len(key_counts), dtype=np.int32)
+            key_to_sample[occupied] = np.arange(len(occupied), dtype=np.int32)
+            inverse = key_to_sample[keys]
+            # Same samples in the same (ascending key) order as the np.unique path
+            samples = np.stack([(occupied >> shift) & 0xFF for shift in (16, 8, 0)],
+                               axis=1).astype(np.float64)
+            return samples, key_counts[occupied].astype(np.float64), inverse
+        if pixels.dtype == np.uint8 and pixels.shape[1] <= 4:
+            keys = _pack_colors(pixels)
+            _, first, inverse, counts = np.unique(
+                keys, return_index=True, return_inverse=True, return_counts=True)
+            samples = pixels[first].astype(np.float64)
+        else:
+            samples, inverse, counts = np.unique(
+                pixels, axis=0, return_inverse=True, return_counts=True)
+            samples = samples.astype(np.float64)
+        return samples, counts.astype(np.float64), inverse.ravel()
+
+    if method == 'histogram':
+        if pixels.dtype != np.uint8:
+            raise ValueError("Histogram quantization requires 8-bit pixels")
+        shift = 8 - int(np.log2(bins))
+        keys = _pack_colors(pixels, shift)
+        # The bin grid is small, so count with bincount instead of sorting
+        bin_counts = np.bincount(keys, minlength=bins ** pixels.shape[1])
+        occupied = np.flatnonzero(bin_counts)
+        bin_to_sample = np.zeros(len(bin_counts), dtype=np.intp)
+        bin_to_sample[occupied] = np.arange(len(occupied))
+        inverse = bin_to_sample[keys]
+        counts = bin_counts[occupied]
+        # Represent each occupied bin by the mean of the pixels that fell in it
+        samples = np.empty((len(counts), pixels.shape[1]), dtype=np.float64)
+        for c in range(pixels.shape[1]):
+            samples[:, c] = np.bincount(
+                inverse, weights=pixels[:, c], minlength=len(counts)) / counts
+        return samples, counts.astype(np.float64), inverse
+
+    raise ValueError(f"Unknown quantization method: {method}")
+
+def quantize_colors(pixels, n_colors, method='exact', bins=32,
+                    random_state=42, n_init=10, init=None):
+    """
+    Cluster an (N, channels) array of pixels into n_colors colours.
+
+    'exact' runs k-means on every pixel. 'unique' runs weighted k-means on
+    the distinct colours, which gives the same clustering objective for a
+    fraction of the work. 'histogram' first groups pixels into bins**3
+    coarse histogram cells. Both compact methods map pixels back to their
+    cluster through a lookup table. Returns (centers, labels).
+
+    init, if given, is a function called with (samples, n_clusters) that
+    returns starting centers; k-means then runs once from them.
+    """
+    if method not in QUANTIZE_METHODS:
+        raise ValueError(f"Unknown quantization method: {method}")
+
+    def make_kmeans(samples, n_clusters):
+        if init is None:
+            return KMeans(n_clusters=n_clusters, random_state=random_state, n_init=n_init)
+        return KMeans(n_clusters=n_clusters, init=init(samples, n_clusters),
+                      random_state=random_state, n_init=1)
+
+    if method == 'exact':
+        kmeans = make_kmeans(pixels, n_colors)
+        labels = kmeans.fit_predict(pixels)
+        return kmeans.cluster_centers_, labels
+
+    samples, weights, inverse = _group_pixels(pixels, method, bins)
+
+    # Never ask for more clusters than there are distinct samples
+    n_clusters = min(n_colors, len(samples))
+    kmeans = make_kmeans(samples, n_clusters)
+    kmeans.fit(samples, sample_weight=weights)
+
+    # Lookup table from sample to cluster, gathered back to every pixel
+    lookup = kmeans.labels_
+    return kmeans.cluster_centers_, lookup[inverse]
+
+def stretch_palette(centers):
+    """Centers stretched linearly to fill 0-255, as an 8-bit palette to gather from."""
+    low, high = centers.min(), centers.max()
+    if high <= low:
+        return np.zeros(centers.shape, dtype=np.uint8)
+    return ((centers - low) / (high - low) * 255).astype(np.uint8)
+
+def assign_palette(pixels, centers, method='exact', bins=32):
+    """
+    Labels for a palette that is already fitted, matching what
+    quantize_colors would return: compact methods label their grouped
+    samples and gather the labels back to every pixel.
+    """
+    if method == 'exact':
+        return assign_labels(pixels, centers)
+    samples, _, inverse = _group_pixels(pixels, method, bins)
+    return assign_labels(samples, centers)[inverse]
+
+# Pixels labelled per pass, bounding the (pixels, k) distance matrix
+_ASSIGN_CHUNK = 1 << 18
+
+def assign_labels(pixels, centers):
+    """Label each pixel with its nearest center, e.g. for a palette fitted on a sample."""
+    centers = np.asarray(centers, dtype=np.float32)
+    squared_norms = (centers ** 2).sum(axis=1)
+    labels = np.empty(len(pixels), dtype=np.int32)
+    for start in range(0, len(pixels), _ASSIGN_CHUNK):
+        chunk = np.asarray(pixels[start:start + _ASSIGN_CHUNK], dtype=np.float32)
+        # Squared distances without materialising (N, k, channels) differences
+        distances = chunk @ centers.T
+        distances *= -2
+        distances += squared_norms
+        labels[start:start + _ASSIGN_CHUNK] = distances.argmin(axis=1)
+    return labels
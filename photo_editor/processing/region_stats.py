@@ -0,0 +1,105 @@
+# photo_editor/processing/region_stats.py
+import numpy as np
+from dataclasses import dataclass
+from scipy import ndimage
+
+@dataclass
+class RegionStats:
+    """Per-label statistics for a label map such as the SLIC superpixels"""
+    counts: np.ndarray       # (n_labels,) pixel count of each label
+    mean_colors: np.ndarray  # (n_labels, channels) mean colour of each label
+    bboxes: np.ndarray       # (n_labels, 4) as (top, left, bottom, right), exclusive
+    centroids: np.ndarray    # (n_labels, 2) as (row, col)
+
+    @property
+    def n_labels(self):
+        return len(self.counts)
+
+    def present(self):
+        """Return a boolean mask of the labels that cover at least one pixel."""
+        return self.counts > 0
+
+# Pixels per bincount pass: weighted bincount makes a float64 copy of its weights
+_CHUNK_PIXELS = 1 << 20
+
+def region_means(labels, image, n_labels=None):
+    """
+    Return (mean_colors, counts) for every label, accumulated over chunks
+    of pixels so no full-size float64 temporaries are made.
+    """
+    flat = np.asarray(labels).ravel()
+    if n_labels is None:
+        n_labels = int(flat.max()) + 1 if flat.size else 0
+    channels = image.reshape(flat.size, -1)
+    sums = np.zeros((n_labels, channels.shape[1]), dtype=np.float64)
+    counts = np.zeros(n_labels, dtype=np.int64)
+    for start in range(0, flat.size, _CHUNK_PIXELS):
+        chunk = flat[start:start + _CHUNK_PIXELS]
+        counts += np.bincount(chunk, minlength=n_labels)
+        for c in range(channels.shape[1]):
+            sums[:, c] += np.bincount(
+                chunk, weights=channels[start:start + _CHUNK_PIXELS, c], minlength=n_labels)
+    return sums / np.maximum(counts, 1)[:, None], counts
+
+def compute_region_stats(labels, image=None):
+    """
+    Compute count, mean colour, bounding box and centroid for every label
+    in one pass over the label map instead of one mask per label. Work
+    goes band by band of rows, so temporaries stay chunk-sized.
+    """
+    labels = np.asarray(labels)
+    flat = labels.ravel()
+    n_labels = int(flat.max()) + 1 if flat.size else 0
+
+    # Mean colour per label, weighted bincounts per channel
+    if image is not None:
+        mean_colors, counts = region_means(labels, image, n_labels)
+    else:
+        counts = np.zeros(n_labels, dtype=np.int64)
+        mean_colors = np.zeros((n_labels, 0), dtype=np.float64)
+
+    height, width = labels.shape[:2]
+    band_rows = max(1, _CHUNK_PIXELS // max(1, width))
+    row_sums = np.zeros(n_labels, dtype=np.float64)
+    col_sums = np.zeros(n_labels, dtype=np.float64)
+    # Bounds start inverted so the first band a label appears in sets them
+    tops = np.full(n_labels, height, dtype=np.int64)
+    lefts = np.full(n_labels, width, dtype=np.int64)
+    bottoms = np.zeros(n_labels, dtype=np.int64)
+    rights = np.zeros(n_labels, dtype=np.int64)
+    columns = np.tile(np.arange(width, dtype=np.float64), band_rows)
+
+    for top in range(0, height, band_rows):
+        band = labels[top:top + band_rows]
+        band_flat = band.ravel()
+        if image is None:
+            counts += np.bincount(band_flat, minlength=n_labels)
+
+        # Centroids from row and column sums
+        rows = np.repeat(np.arange(top, top + len(band), dtype=np.float64), width)
+        row_sums += np.bincount(band_flat, weights=rows, minlength=n_labels)
+        col_sums += np.bincount(band_flat, weights=columns[:band_flat.size],
+                                minlength=n_labels)
+
+        # Bounding boxes of this band, merged into the running ones
+        for index, slices in enumerate(ndimage.find_objects(band + 1, max_label=n_labels)):
+            if slices is not None:
+                tops[index] = min(tops[index], top + slices[0].start)
+                bottoms[index] = max(bottoms[index], top + slices[0].stop)
+                lefts[index] = min(lefts[index], slices[1].start)
+                rights[index] = max(rights[index], slices[1].stop)
+
+    safe_counts = np.maximum(counts, 1)
+    centroids = np.stack([row_sums / safe_counts, col_sums / safe_counts], axis=1)
+    # Labels that never occur keep an empty box
+    bboxes = np.stack([tops, lefts, bottoms, rights], axis=1)
+    bboxes[counts == 0] = 0
+    return RegionStats(counts, mean_colors, bboxes, centroids)
+
+def paint_regions(labels, values, dtype=np.uint8):
+    """Paint per-label values back onto the label map with a single gather."""
+    values = np.asarray(values)
+    if np.issubdtype(dtype, np.integer) and not np.issubdtype(values.dtype, np.integer):
+        info = np.iinfo(dtype)
+        values = np.clip(np.rint(values), info.min, info.max)
+    return values.astype(dtype, copy=False)[labels]
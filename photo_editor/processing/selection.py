@@ -0,0 +1,88 @@
+# photo_editor/processing/selection.py
+from dataclasses import dataclass
+import cv2
+import numpy as np
+from photo_editor.processing.tiling import gaussian_halo
+
+SELECTION_SHAPES = ('rectangle', 'freehand')
+
+@dataclass(frozen=True)
+class Selection:
+    """
+    The part of the image an operation is limited to: a polygon (four
+    corners for a rectangle) with coordinates relative to the image size,
+    so the same selection fits a preview and the full resolution. feather
+    fades the edge over about that many pixels of the processed image.
+    Tuples keep it hashable, so it can be part of an edit step.
+    """
+    points: tuple        # ((x, y), ...) with x and y in 0..1
+    feather: float = 0.0
+
+    @classmethod
+    def rectangle(cls, left, top, right, bottom, feather=0.0):
+        left, right = sorted((left, right))
+        top, bottom = sorted((top, bottom))
+        return cls.polygon([(left, top), (right, top), (right, bottom), (left, bottom)],
+                           feather)
+
+    @classmethod
+    def polygon(cls, points, feather=0.0):
+        points = np.clip(np.asarray(points, dtype=np.float64), 0.0, 1.0)
+        if points.ndim != 2 or points.shape[1] != 2 or len(points) < 3:
+            raise ValueError("A selection needs at least three (x, y) points")
+        return cls(tuple((round(float(x), 6), round(float(y), 6)) for x, y in points),
+                   float(max(0.0, feather)))
+
+    def pixel_points(self, shape):
+        """The polygon in pixel coordinates of an image of this shape."""
+        height, width = shape[:2]
+        return np.asarray(self.points) * (width, height)
+
+    def feather_reach(self):
+        """Pixels the feathered edge extends beyond the polygon."""
+        return gaussian_halo(self.feather / 3) if self.feather > 0 else 0
+
+    def bounds(self, shape, margin=0):
+        """
+        (top, left, bottom, right) of the selection, exclusive, grown by
+        the feathered edge and margin and clamped to the image. Empty
+        selections give a box with no area.
+        """
+        height, width = shape[:2]
+        points = self.pixel_points(shape)
+        grow = self.feather_reach() + margin
+        left, top = np.floor(points.min(axis=0)).astype(int) - grow
+        right, bottom = np.ceil(points.max(axis=0)).astype(int) + grow
+        return (max(0, int(top)), max(0, int(left)),
+                min(height, int(bottom)), min(width, int(right)))
+
+    def mask(self, shape, box):
+        """
+        Coverage of the pixels inside box: a boolean mask for a hard edge,
+        float32 weights in 0..1 when feathered.
+        """
+        top, left, bottom, right = box
+        polygon = np.rint(self.pixel_points(shape) - (left, top)).astype(np.int32)
+        mask = np.zeros((bottom - top, right - left), dtype=np.uint8)
+        cv2.fillPoly(mask, [polygon], 255)
+        if self.feather <= 0:
+            return mask > 0
+        weights = cv2.GaussianBlur(mask, (0, 0), self.feather / 3).astype(np.float32)
+        weights *= 1 / 255
+        return weights
+
+def composite(image, result, mask, out=None):
+    """Blend result over image (same shape) by mask, writing into out."""
+    if out is None:
+        out = image.copy()
+    elif out is not image:
+        out[...] = image
+    if mask.dtype == bool:
+        np.copyto(out, result, where=mask[..., None])
+    else:
+        weights = mask[..., None]
+        blended = image.astype(np.float32)
+        blended += (result.astype(np.float32) - blended) * weights
+        np.rint(blended, out=blended)
+        out[...] = blended
+    return out
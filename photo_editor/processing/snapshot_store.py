@@ -0,0 +1,235 @@
+# photo_editor/processing/snapshot_store.py
+import atexit
+import os
+import pickle
+import shutil
+import tempfile
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+import numpy as np
+from photo_editor.processing.backing_store import is_mapped
+from photo_editor.processing.tiling import iter_tiles
+
+@dataclass
+class Snapshot:
+    """One stored image: the tiles that differ from its parent, compressed"""
+    shape: tuple
+    dtype: np.dtype
+    parent: object           # Key of the snapshot this is a delta against; None for a keyframe
+    depth: int               # Deltas between this snapshot and its keyframe
+    changed: np.ndarray      # Bool grid of tiles stored in this snapshot
+    tiles: dict = None       # (row, column) -> zlib bytes, once compressed and while in RAM
+    nbytes: int = 0          # Compressed size
+    spill_path: str = None   # File holding tiles after they were spilled to disk
+
+class SnapshotStore:
+    """
+    Budgeted store of edit history results, used as EditHistory's cache.
+
+    Each snapshot keeps only the tiles that differ from its parent
+    (the previous step's result), compressed losslessly with zlib. The
+    hot_entries most recently used snapshots are also kept decompressed.
+    When the store's RAM use passes max_bytes, the least recently used
+    compressed snapshots are spilled to disk. Past max_disk_bytes, the
+    oldest are dropped along with the deltas that depend on them;
+    EditHistory recomputes anything missing.
+
+    Delta chains are at most max_chain long, and a restore decompresses
+    each tile once (from the newest snapshot in the chain that has it),
+    so restoring any snapshot costs at most one full decompression.
+    """
+    def __init__(self, max_bytes=1024 * 1024 * 1024, hot_entries=2, tile_size=256,
+                 max_chain=8, max_disk_bytes=8 * 1024 * 1024 * 1024, spill_dir=None,
+                 compression_level=1):
+        self.max_bytes = max_bytes
+        self.hot_entries = hot_entries
+        self.tile_size = tile_size
+        self.max_chain = max_chain
+        self.max_disk_bytes = max_disk_bytes
+        self.spill_dir = spill_dir
+        self.compression_level = compression_level
+        self.entries = OrderedDict()  # key -> Snapshot, least recently used first
+        self.hot = OrderedDict()      # key -> decompressed array, least recently used first
+        self.children = {}            # key -> keys of the snapshots that are deltas against it
+        self.ram_bytes = 0
+        self.disk_bytes = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        if key not in self.entries:
+            return None
+        self.entries.move_to_end(key)
+        image = self.hot.get(key)
+        if image is None:
+            image = self._restore(key)
+            self._make_hot(key, image)
+        else:
+            self.hot.move_to_end(key)
+        return image
+
+    def put(self, key, image, parent=None):
+        """Store image under key, as a delta against the snapshot stored under parent."""
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return
+
+        grid = self._grid(image.shape)
+        changed = np.ones(grid, dtype=bool)
+        depth = 0
+        parent_snapshot = self.entries.get(parent) if parent is not None else None
+        if (parent_snapshot is not None and parent_snapshot.shape == image.shape and
+                parent_snapshot.dtype == image.dtype and parent_snapshot.depth < self.max_chain):
+            parent_image = self.get(parent)
+            for row, column, window in self._tile_windows(image.shape):
+                changed[row, column] = not np.array_equal(image[window], parent_image[window])
+            if not changed.all():
+                depth = parent_snapshot.depth + 1
+            else:
+                parent = None  # Everything changed: a keyframe costs the same and depends on nothing
+        else:
+            parent = None
+
+        self.entries[key] = Snapshot(image.shape, image.dtype, parent if depth else None,
+                                     depth, changed)
+        if depth:
+            self.children.setdefault(parent, set()).add(key)
+        self._make_hot(key, image)
+        self._enforce_budget()
+
+    def clear(self):
+        for snapshot in self.entries.values():
+            self._remove_spill(snapshot)
+        self.entries.clear()
+        self.hot.clear()
+        self.children.clear()
+        self.ram_bytes = 0
+        self.disk_bytes = 0
+
+    def _grid(self, shape):
+        size = self.tile_size
+        return (-(-shape[0] // size), -(-shape[1] // size))
+
+    def _tile_windows(self, shape):
+        size = self.tile_size
+        for top, bottom, left, right in iter_tiles(shape, size):
+            yield top // size, left // size, (slice(top, bottom), slice(left, right))
+
+    def _hot_bytes(self, image):
+        # Mapped arrays live in the backing store's files, not in RAM
+        return 0 if is_mapped(image) else image.nbytes
+
+    def _make_hot(self, key, image):
+        if key not in self.hot:
+            self.hot[key] = image
+            self.ram_bytes += self._hot_bytes(image)
+        self.hot.move_to_end(key)
+        while len(self.hot) > self.hot_entries:
+            self._demote(next(iter(self.hot)))
+
+    def _demote(self, key):
+        """Compress a hot snapshot's tiles and drop its decompressed array."""
+        image = self.hot.pop(key)
+        self.ram_bytes -= self._hot_bytes(image)
+        snapshot = self.entries.get(key)
+        if snapshot is None or snapshot.tiles is not None or snapshot.spill_path is not None:
+            return  # Already compressed on an earlier demotion
+        snapshot.tiles = {}
+        for row, column, window in self._tile_windows(snapshot.shape):
+            if snapshot.changed[row, column]:
+                snapshot.tiles[row, column] = zlib.compress(
+                    np.ascontiguousarray(image[window]), self.compression_level)
+        snapshot.nbytes = sum(len(blob) for blob in snapshot.tiles.values())
+        self.ram_bytes += snapshot.nbytes
+
+    def _restore(self, key):
+        """Rebuild a snapshot's image from its delta chain."""
+        snapshot = self.entries[key]
+        image = np.empty(snapshot.shape, snapshot.dtype)
+        filled = np.zeros(snapshot.changed.shape, dtype=bool)
+        base = None
+        while True:
+            # Newest snapshot first: each tile is taken from the first one that has it
+            needed = snapshot.changed & ~filled
+            if needed.any():
+                tiles = self._load_tiles(snapshot)
+                for row, column, window in self._tile_windows(snapshot.shape):
+                    if needed[row, column]:
+                        tile = np.frombuffer(zlib.decompress(tiles[row, column]), snapshot.dtype)
+                        image[window] = tile.reshape(image[window].shape)
+                filled |= needed
+            if filled.all() or snapshot.parent is None:
+                break
+            base = self.hot.get(snapshot.parent)
+            if base is not None:
+                break
+            snapshot = self.entries[snapshot.parent]
+
+        if base is not None:
+            # Remaining tiles are unchanged since a decompressed ancestor
+            for row, column, window in self._tile_windows(image.shape):
+                if not filled[row, column]:
+                    image[window] = base[window]
+        image.setflags(write=False)
+        return image
+
+    def _load_tiles(self, snapshot):
+        if snapshot.tiles is not None:
+            return snapshot.tiles
+        with open(snapshot.spill_path, 'rb') as f:
+            return pickle.load(f)
+
+    def _enforce_budget(self):
+        # Spill the least recently used compressed snapshots to disk
+        for key, snapshot in list(self.entries.items()):
+            if self.ram_bytes <= self.max_bytes:
+                break
+            if snapshot.tiles is not None and key not in self.hot:
+                self._spill(snapshot)
+        # Then decompressed copies, keeping the newest
+        while self.ram_bytes > self.max_bytes and len(self.hot) > 1:
+            key = next(iter(self.hot))
+            self._demote(key)
+            if self.entries[key].tiles is not None:
+                self._spill(self.entries[key])
+        # Past the disk budget, forget the oldest snapshots and what depends on them
+        while self.disk_bytes > self.max_disk_bytes and self.entries:
+            self._drop(next(iter(self.entries)))
+
+    def _spill(self, snapshot):
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix='photo_editor-history-')
+            atexit.register(shutil.rmtree, self.spill_dir, True)
+        fd, path = tempfile.mkstemp(suffix='.snapshot', dir=self.spill_dir)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(snapshot.tiles, f, protocol=pickle.HIGHEST_PROTOCOL)
+        snapshot.spill_path = path
+        snapshot.tiles = None
+        self.ram_bytes -= snapshot.nbytes
+        self.disk_bytes += snapshot.nbytes
+
+    def _remove_spill(self, snapshot):
+        if snapshot.spill_path is not None:
+            try:
+                os.remove(snapshot.spill_path)
+            except OSError:
+                pass
+
+    def _drop(self, key):
+        for child in list(self.children.pop(key, ())):
+            self._drop(child)
+        snapshot = self.entries.pop(key, None)
+        if snapshot is None:
+            return
+        image = self.hot.pop(key, None)
+        if image is not None:
+            self.ram_bytes -= self._hot_bytes(image)
+        if snapshot.spill_path is not None:
+            self.disk_bytes -= snapshot.nbytes
+            self._remove_spill(snapshot)
+        elif snapshot.tiles is not None:
+            self.ram_bytes -= snapshot.nbytes
+        if snapshot.parent is not None:
+            self.children.get(snapshot.parent, set()).discard(key)
@@ -0,0 +1,154 @@
+# photo_editor/processing/superpixels.py
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from skimage.segmentation import slic
+from photo_editor.processing.region_stats import region_means
+
+SUPERPIXEL_BACKENDS = ('auto', 'skimage', 'tiled', 'ximgproc')
+
+# Below this size splitting into tiles costs more than it saves
+TILED_MIN_PIXELS = 2_000_000
+
+def has_ximgproc():
+    """True when OpenCV was built with the contrib ximgproc module."""
+    return hasattr(cv2, 'ximgproc') and hasattr(cv2.ximgproc, 'createSuperpixelSLIC')
+
+def resolve_backend(backend, shape):
+    """
+    Pick the concrete backend for 'auto' on an image of this shape:
+    ximgproc when installed, the tile-parallel SLIC on multi-core machines
+    for large images, otherwise scikit-image.
+    """
+    if backend != 'auto':
+        if backend == 'ximgproc' and not has_ximgproc():
+            raise ValueError("The 'ximgproc' superpixel backend needs opencv-contrib-python")
+        if backend not in SUPERPIXEL_BACKENDS:
+            raise ValueError(f"Unknown superpixel backend: {backend}")
+        return backend
+    if has_ximgproc():
+        return 'ximgproc'
+    if (os.cpu_count() or 1) > 1 and shape[0] * shape[1] >= TILED_MIN_PIXELS:
+        return 'tiled'
+    return 'skimage'
+
+def superpixel_labels(image, n_segments, compactness, sigma, backend='auto'):
+    """Superpixel int32 label map of image (labels start at 0) from the chosen backend."""
+    backend = resolve_backend(backend, image.shape)
+    if backend == 'ximgproc':
+        labels = _slic_ximgproc(image, n_segments, compactness)
+    elif backend == 'tiled':
+        labels = _slic_tiled(image, n_segments, compactness, sigma)
+    else:
+        labels = _slic_skimage(image, n_segments, compactness, sigma)
+    return labels.astype(np.int32, copy=False)
+
+def _slic_skimage(image, n_segments, compactness, sigma):
+    if image.dtype == np.uint8:
+        # skimage would work in float64; float32 in the same 0-1 range halves its buffers
+        image = image.astype(np.float32)
+        image *= np.float32(1 / 255)
+    return slic(image, n_segments=n_segments, compactness=compactness, sigma=sigma,
+                start_label=0)
+
+def _slic_ximgproc(image, n_segments, compactness):
+    height, width = image.shape[:2]
+    region_size = max(2, int(round(math.sqrt(height * width / max(1, n_segments)))))
+    superpixels = cv2.ximgproc.createSuperpixelSLIC(
+        image, algorithm=cv2.ximgproc.SLIC, region_size=region_size, ruler=float(compactness))
+    superpixels.iterate(10)
+    # Absorb fragments smaller than a quarter of a superpixel, as skimage does
+    superpixels.enforceLabelConnectivity(25)
+    return superpixels.getLabels()
+
+def _tile_bounds(length, tiles, step):
+    """Tile edges along one axis, snapped to multiples of the superpixel spacing."""
+    edges = {0, length}
+    for index in range(1, tiles):
+        edges.add(min(length, int(round(length * index / tiles / step) * step)))
+    return sorted(edges)
+
+def _slic_tiled(image, n_segments, compactness, sigma, workers=None):
+    """
+    SLIC run on a grid of tiles in parallel threads, then stitched.
+
+    Tile edges fall on the superpixel grid, so each tile seeds the same
+    clusters the whole-image run would. Superpixels cut in two by a tile
+    edge are merged back when the pieces are small and alike in colour.
+    scikit-image's SLIC releases the GIL, so threads run truly in parallel.
+    """
+    height, width = image.shape[:2]
+    workers = workers or os.cpu_count() or 1
+    step = math.sqrt(height * width / max(1, n_segments))
+
+    columns = max(1, round(math.sqrt(workers * width / height)))
+    rows = max(1, math.ceil(workers / columns))
+    row_edges = _tile_bounds(height, rows, step)
+    column_edges = _tile_bounds(width, columns, step)
+    windows = [(top, bottom, left, right)
+               for top, bottom in zip(row_edges, row_edges[1:])
+               for left, right in zip(column_edges, column_edges[1:])]
+
+    def run(window):
+        top, bottom, left, right = window
+        share = (bottom - top) * (right - left) / (height * width)
+        return _slic_skimage(image[top:bottom, left:right],
+                             max(1, round(n_segments * share)), compactness, sigma)
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(windows))) as pool:
+        tile_labels = list(pool.map(run, windows))
+
+    labels = np.empty((height, width), dtype=np.int32)
+    offset = 0
+    for (top, bottom, left, right), tile in zip(windows, tile_labels):
+        labels[top:bottom, left:right] = tile + offset
+        offset += int(tile.max()) + 1
+
+    return _merge_cut_superpixels(labels, image, row_edges, column_edges, step * step,
+                                  2.0 * compactness)
+
+def _merge_cut_superpixels(labels, image, row_edges, column_edges, expected_area,
+                           max_color_distance):
+    """Join superpixels split by tile edges; returns consecutive labels from 0."""
+    count = int(labels.max()) + 1
+    means, areas = region_means(labels, image, count)
+
+    # Label pairs facing each other across every internal tile edge, with
+    # the number of pixels along which they touch
+    pairs = [np.stack([labels[:, edge - 1], labels[:, edge]], axis=1)
+             for edge in column_edges[1:-1]]
+    pairs += [np.stack([labels[edge - 1, :], labels[edge, :]], axis=1)
+              for edge in row_edges[1:-1]]
+    parent = np.arange(count)
+    if pairs:
+        pairs = np.concatenate(pairs).astype(np.int64)
+        keys, contacts = np.unique(pairs[:, 0] * count + pairs[:, 1], return_counts=True)
+
+        def find(label):
+            while parent[label] != label:
+                parent[label] = parent[parent[label]]
+                label = parent[label]
+            return label
+
+        merged_areas = areas.astype(np.float64)
+        # Longest shared borders first: those are most likely one cut superpixel
+        for key in keys[np.argsort(-contacts, kind='stable')]:
+            a, b = find(key // count), find(key % count)
+            if a == b:
+                continue
+            if min(merged_areas[a], merged_areas[b]) > 0.75 * expected_area:
+                continue  # Both already full-sized: a genuine boundary
+            if merged_areas[a] + merged_areas[b] > 1.5 * expected_area:
+                continue
+            if np.linalg.norm(means[key // count] - means[key % count]) > max_color_distance:
+                continue
+            parent[b] = a
+            merged_areas[a] += merged_areas[b]
+        roots = np.array([find(label) for label in range(count)])
+    else:
+        roots = parent
+
+    _, consecutive = np.unique(roots, return_inverse=True)
+    return consecutive.astype(np.int32)[labels]
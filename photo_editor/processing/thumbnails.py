@@ -0,0 +1,135 @@
+# photo_editor/processing/thumbnails.py
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+import cv2
+
+THUMBNAIL_SIZE = 256  # Longest side in pixels
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'photo_editor', 'thumbnails')
+
+def thumbnail_key(path):
+    """Cache key from the file's path, modification time and size, so edits invalidate it."""
+    stat = os.stat(path)
+    identity = f"{os.path.abspath(path)}\0{stat.st_mtime_ns}\0{stat.st_size}"
+    return hashlib.sha1(identity.encode('utf-8')).hexdigest()
+
+def make_thumbnail(image, size=THUMBNAIL_SIZE):
+    height, width = image.shape[:2]
+    scale = size / max(height, width)
+    if scale >= 1:
+        return image
+    target = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(image, target, interpolation=cv2.INTER_AREA)
+
+class ThumbnailCache:
+    """
+    On-disk thumbnail store bounded by total bytes, evicting the least
+    recently used files first.
+
+    Files are named by thumbnail_key(), so a changed source simply misses
+    and its stale thumbnail ages out. Safe to use from several threads.
+    """
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=512 * 1024 * 1024,
+                 size=THUMBNAIL_SIZE, quality=85):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = size
+        self.quality = quality
+        self.entries = None  # key -> bytes on disk, least recently used first
+        self.total_bytes = 0
+        self._lock = threading.Lock()
+
+    def _path_for(self, key):
+        return os.path.join(self.directory, key[:2], key + '.jpg')
+
+    def _load_index(self):
+        # Rebuild the LRU order from file modification times, which are
+        # refreshed on every hit
+        found = []
+        if os.path.isdir(self.directory):
+            for bucket in os.scandir(self.directory):
+                if not bucket.is_dir():
+                    continue
+                for entry in os.scandir(bucket.path):
+                    if entry.name.endswith('.jpg'):
+                        stat = entry.stat()
+                        found.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        found.sort()
+        self.entries = OrderedDict((key, size) for _, key, size in found)
+        self.total_bytes = sum(self.entries.values())
+
+    def get(self, path):
+        """Return the cached thumbnail of an image file, or None."""
+        key = thumbnail_key(path)
+        with self._lock:
+            if self.entries is None:
+                self._load_index()
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+        thumbnail_path = self._path_for(key)
+        thumbnail = cv2.imread(thumbnail_path)
+        if thumbnail is None:
+            with self._lock:
+                self.total_bytes -= self.entries.pop(key, 0)
+            return None
+        try:
+            os.utime(thumbnail_path)
+        except OSError:
+            pass
+        return thumbnail
+
+    def put(self, path, thumbnail):
+        key = thumbnail_key(path)
+        ok, encoded = cv2.imencode('.jpg', thumbnail, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            return
+        thumbnail_path = self._path_for(key)
+        os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+        # Write then rename, so readers never see a partial file
+        temp_path = f"{thumbnail_path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(encoded.tobytes())
+        os.replace(temp_path, thumbnail_path)
+
+        with self._lock:
+            if self.entries is None:
+                self._load_index()
+            self.total_bytes += encoded.nbytes - self.entries.pop(key, 0)
+            self.entries[key] = encoded.nbytes
+            evicted = []
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                old_key, old_size = self.entries.popitem(last=False)
+                self.total_bytes -= old_size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self._path_for(old_key))
+            except OSError:
+                pass
+
+    def load(self, path):
+        """Return the thumbnail of an image file, generating and storing it on a miss."""
+        thumbnail = self.get(path)
+        if thumbnail is not None:
+            return thumbnail
+        image = cv2.imread(path)
+        if image is None:
+            return None
+        thumbnail = make_thumbnail(image, self.size)
+        self.put(path, thumbnail)
+        return thumbnail
+
+    def clear(self):
+        with self._lock:
+            if self.entries is None:
+                self._load_index()
+            keys = list(self.entries)
+            self.entries.clear()
+            self.total_bytes = 0
+        for key in keys:
+            try:
+                os.remove(self._path_for(key))
+            except OSError:
+                pass
@@ -0,0 +1,73 @@
+# photo_editor/processing/tiling.py
+import math
+import numpy as np
+from dataclasses import dataclass
+
+@dataclass
+class TilingConfig:
+    """Settings for the memory-bounded tiled execution mode"""
+    memory_budget_mb: float = 2048.0  # Cap on working memory for a processing stage
+    bytes_per_pixel: int = 96         # Estimated working bytes per pixel of the heaviest stage
+    sample_pixels: int = 1_000_000    # Pixels sampled when fitting a global palette
+    min_tile_size: int = 256          # Never split into tiles smaller than this
+
+    @property
+    def budget_bytes(self):
+        return int(self.memory_budget_mb * 1024 * 1024)
+
+    def needs_tiling(self, image):
+        """Return True when processing the whole image at once would exceed the budget."""
+        height, width = image.shape[:2]
+        return height * width * self.bytes_per_pixel > self.budget_bytes
+
+    def tile_size(self, halo=0):
+        """Side length of a square tile whose haloed window fits the budget."""
+        side = int(math.sqrt(self.budget_bytes / self.bytes_per_pixel)) - 2 * halo
+        return max(self.min_tile_size, side)
+
+def gaussian_halo(sigma):
+    """Number of pixels a Gaussian blur with this sigma reads beyond a tile."""
+    return int(math.ceil(4 * sigma)) + 1
+
+def iter_tiles(shape, tile_size):
+    """Yield (top, bottom, left, right) bounds of the tiles covering an image."""
+    height, width = shape[:2]
+    for top in range(0, height, tile_size):
+        for left in range(0, width, tile_size):
+            yield top, min(top + tile_size, height), left, min(left + tile_size, width)
+
+def apply_tiled(image, func, tile_size, halo=0, out=None, extra=(), allocate=np.empty):
+    """
+    Run func tile by tile and stitch the results into a single output.
+
+    Each call receives the tile grown by halo pixels on every side (clamped
+    to the image) so neighbourhood filters see the same context they would
+    on the whole image, and only the tile's own core is written to out.
+    Arrays in extra are cropped to the same window and passed after image.
+    Without out, the output is created by allocate(shape, dtype), which can
+    be BackingStore.empty to stream the result to disk.
+    """
+    height, width = image.shape[:2]
+    for top, bottom, left, right in iter_tiles(image.shape, tile_size):
+        window_top, window_left = max(0, top - halo), max(0, left - halo)
+        window = (slice(window_top, min(height, bottom + halo)),
+                  slice(window_left, min(width, right + halo)))
+
+        tile_result = func(image[window], *(array[window] for array in extra))
+
+        if out is None:
+            out = allocate((height, width) + tile_result.shape[2:], tile_result.dtype)
+
+        # Keep only the core of the tile, dropping the halo
+        core_top, core_left = top - window_top, left - window_left
+        out[top:bottom, left:right] = tile_result[
+            core_top:core_top + (bottom - top),
+            core_left:core_left + (right - left)]
+    return out
+
+def sample_pixels(image, max_pixels):
+    """Return an evenly strided sample of at most max_pixels pixels as (N, channels)."""
+    height, width = image.shape[:2]
+    step = max(1, int(math.ceil(math.sqrt(height * width / max_pixels))))
+    sample = image[::step, ::step]
+    return sample.reshape(-1, image.shape[2] if image.ndim == 3 else 1)
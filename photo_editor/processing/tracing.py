@@ -0,0 +1,182 @@
+# photo_editor/processing/tracing.py
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+# Set to 1 to record allocated_bytes and peak_bytes on every span (GUI and batch)
+TRACE_MEMORY_ENV = 'PHOTO_EDITOR_TRACE_MEMORY'
+
+def memory_tracing_enabled():
+    return os.environ.get(TRACE_MEMORY_ENV, '').lower() in ('1', 'true', 'yes', 'on')
+
+@dataclass
+class SpanEvent:
+    """A finished span: one named stage of a processing run"""
+    name: str
+    start: float             # perf_counter() seconds
+    duration: float          # seconds
+    thread_id: int
+    depth: int               # nesting level, 0 for the operation itself
+    args: dict = field(default_factory=dict)
+
+class Tracer:
+    """
+    Lightweight named spans around processing stages, sent to pluggable sinks.
+
+    With no sinks attached a span costs two attribute lookups, so the hooks
+    can stay in the hot paths permanently.
+    """
+    def __init__(self, sinks=None, track_allocations=None):
+        self.sinks = list(sinks or [])
+        # Net and peak traced allocation per span; needs tracemalloc, which slows NumPy down.
+        # tracemalloc is process-wide, so spans on concurrent threads see each other's peaks.
+        # None follows the PHOTO_EDITOR_TRACE_MEMORY environment variable
+        if track_allocations is None:
+            track_allocations = memory_tracing_enabled()
+        self.track_allocations = track_allocations
+        self._local = threading.local()
+
+    def add_sink(self, sink):
+        if sink not in self.sinks:
+            self.sinks.append(sink)
+
+    def remove_sink(self, sink):
+        if sink in self.sinks:
+            self.sinks.remove(sink)
+
+    @contextmanager
+    def span(self, name, image=None, **args):
+        """Time the enclosed block; image, if given, is recorded as the input size."""
+        if not self.sinks:
+            yield
+            return
+
+        if image is not None:
+            args['input_shape'] = list(image.shape)
+            args['input_bytes'] = int(image.nbytes)
+
+        depth = getattr(self._local, 'depth', 0)
+        self._local.depth = depth + 1
+        for sink in self.sinks:
+            sink.span_started(name, depth)
+
+        tracking = self.track_allocations
+        if tracking:
+            frame = self._push_memory_frame()
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            if tracking:
+                allocated, peak = self._pop_memory_frame(frame)
+                args['allocated_bytes'] = allocated
+                args['peak_bytes'] = peak
+            self._local.depth = depth
+            event = SpanEvent(name, start, duration, threading.get_ident(), depth, args)
+            for sink in list(self.sinks):
+                sink.span_finished(event)
+
+    def _push_memory_frame(self):
+        """
+        Start measuring a span's peak. tracemalloc keeps a single peak, so
+        the enclosing span's peak so far is saved before it is reset.
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        stack = getattr(self._local, 'memory_stack', None)
+        if stack is None:
+            stack = self._local.memory_stack = []
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1][1] = max(stack[-1][1], peak)
+        tracemalloc.reset_peak()
+        frame = [current, current]  # Traced bytes at the start, highest seen since
+        stack.append(frame)
+        return frame
+
+    def _pop_memory_frame(self, frame):
+        """Finish a span's measurement; returns (net, peak) bytes above its start."""
+        current, peak = tracemalloc.get_traced_memory()
+        frame[1] = max(frame[1], peak)
+        stack = self._local.memory_stack
+        stack.pop()
+        if stack:
+            stack[-1][1] = max(stack[-1][1], frame[1])
+        return current - frame[0], frame[1] - frame[0]
+
+class TraceSink:
+    """Base sink; override whichever callbacks are needed"""
+    def span_started(self, name, depth):
+        pass
+
+    def span_finished(self, event):
+        pass
+
+class LoggingSink(TraceSink):
+    """Log every finished span"""
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger('photo_editor.trace')
+        self.level = level
+
+    def span_finished(self, event):
+        self.logger.log(self.level, "%s%s %.3fs %s", '  ' * event.depth,
+                        event.name, event.duration, event.args or '')
+
+class CallbackSink(TraceSink):
+    """Forward span start/finish to in-process callbacks"""
+    def __init__(self, on_start=None, on_finish=None):
+        self.on_start = on_start
+        self.on_finish = on_finish
+
+    def span_started(self, name, depth):
+        if self.on_start is not None:
+            self.on_start(name, depth)
+
+    def span_finished(self, event):
+        if self.on_finish is not None:
+            self.on_finish(event)
+
+class ChromeTraceSink(TraceSink):
+    """
+    Collect spans and write them in the Chrome trace event format, viewable
+    in chrome://tracing or Perfetto.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.events = []
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self.events = []
+
+    def span_finished(self, event):
+        with self._lock:
+            self.events.append(event)
+
+    def to_json(self):
+        with self._lock:
+            events = list(self.events)
+        return {
+            'traceEvents': [{
+                'name': event.name,
+                'ph': 'X',
+                'ts': event.start * 1e6,
+                'dur': event.duration * 1e6,
+                'pid': os.getpid(),
+                'tid': event.thread_id,
+                'args': event.args,
+            } for event in events],
+            'displayTimeUnit': 'ms',
+        }
+
+    def write(self, path=None):
+        with open(path or self.path, 'w') as f:
+            json.dump(self.to_json(), f)